@@ -1,8 +1,29 @@
-from bs4 import BeautifulSoup
-import requests
-import pandas as pd
-from time import sleep
-from random import randint
+from __future__ import annotations
+from collections import deque
+from urllib.parse import urljoin
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from function.lazy import LazyModule
+from function.buffers import ColumnBuffers
+from function.export import write_dataset
+from function.diff import diff_with_snapshot
+from function.enrich import DetailEnricher
+from function.extractor import COLUMNS as RAW_COLUMNS, extractor
+from function.normalize import Normalized, normalize_records, select_rows
+from function.query import MarketIndex
+from function.seen import SeenIndex
+from function.sinks import SqliteSink
+from function.cache import ResponseCache
+from function.checkpoint import Checkpoint
+from function.listing import ListingQuery
+from function.metrics import CrawlStats
+from function.fetch import AdaptiveRateLimiter, FetchError, RateLimiter, Transport, fetch_pages
+from function.parsing import extract_page, parse_listing
+
+pd = LazyModule("pandas")
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 
 class autoplius_scraper:
@@ -11,24 +32,61 @@ class autoplius_scraper:
     extracts information about marque, manufacturing date, price (in €) as well as technical details:
     engine (in l), types of vehicle, fuel and gearbox, engine power (in kW) and mileage (in km).
     Data is returned in pandas DataFrame format and then is exported to autoplius.csv file in the repository.
+
+    Parameters:
+        * parser(str): BeautifulSoup tree builder used to parse pages ("html.parser", "lxml" or "html5lib").
+          function.parsing.fastest_parser() reports the fastest one giving identical records.
+        * only_announcements(bool): parse only the announcement-item adverts instead of the whole page.
+        * cache(ResponseCache): an optional on-disk response cache; with ResponseCache(offline=True) the scraper replays
+          captured pages without using the network.
+        * seen(SeenIndex): the index of ad IDs collected so far. Crawls drop adverts which are already in it, so listings shifting
+          between pages are not collected twice; SeenIndex(path) keeps the index on disk to drop duplicates across runs as well.
+        * throttle(AdaptiveRateLimiter): the adaptive request rate used by crawls without a fixed rate; its floor and ceiling
+          bound the rate in requests per second.
+        * transport(Transport): the HTTP layer with timeouts, retries and the response size limit; by default
+          Transport(limiter=throttle). A given transport keeps its own limiter.
+        * stats(CrawlStats): the instrumentation which times every stage and counts pages, bytes, adverts, cache hits and
+          extraction failures; a new CrawlStats by default.
+        * base_url(str): the website crawled by multiple_scrapes() and iter_pages(), e.g. the address of a local
+          function.fake_server.FakeListingServer for load tests.
+        * enricher(DetailEnricher): follows advert links to their detail pages in enrich_details(); by default one sharing
+          the transport and cache of the scraper is created when needed.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        parser: str = "html.parser",
+        only_announcements: bool = False,
+        cache: ResponseCache = None,
+        seen: SeenIndex = None,
+        throttle: AdaptiveRateLimiter = None,
+        transport: Transport = None,
+        stats: CrawlStats = None,
+        base_url: str = "https://en.autoplius.lt",
+        enricher: DetailEnricher = None,
+    ):
+        self.__parser = parser
+        self.__only_announcements = only_announcements
+        self.__cache = cache
+        self.__seen = seen if seen is not None else SeenIndex()
+        self.__throttle = throttle if throttle is not None else AdaptiveRateLimiter()
+        self.__transport = transport if transport is not None else Transport(limiter=self.__throttle)
+        # The limiter which paced the last crawl: the transport's own, or the fixed budget of multiple_scrapes(rate=...).
+        self.__limiter = self.__transport.limiter
         self.__page_no = 0
         self.__soup = None
         self.__cars = None
-        (
-            self.__marques,
-            self.__engines,
-            self.__carTypes,
-            self.__years,
-            self.__fuels,
-            self.__gearboxes,
-            self.__powers,
-            self.__mileages,
-            self.__prices,
-        ) = ([] for i in range(9))
+        self.__records = None
+        self.__normalized = None
+        self.__page_keyed = False
+        self.__columns = ColumnBuffers()
+        self.__failures = []
         self.__result = None
+        self.__failed_pages = []
+        self.__stats = stats if stats is not None else CrawlStats()
+        self.__base_url = base_url.rstrip("/")
+        self.__enricher = enricher
+        self.__links = {}
 
     def getPageNo(self, sample_size: int) -> int:
         """
@@ -46,29 +104,46 @@ class autoplius_scraper:
 
     def scrape_page(self, URL: str) -> BeautifulSoup:
         """
-        Scrapes the given URL address and returns a soup object.
+        Scrapes the given URL address and returns a soup object. When a cache is set in init method, the page is served from it if possible.
+        Timeouts, connection errors and 429/5xx responses are retried by the transport of init method.
 
         Parameters:
             * URL(str): website address which will be scraped.
 
         Returns:
             * soup(BeautifulSoup): BeautifulSoup object, which contains html code. The object becomes an attribute of init method.
+
+        Raises:
+            * FetchError: the page could not be downloaded; its PageResult is available as error.page.
         """
         print(f"Start scraping {URL}")
-        page = requests.get(
-            URL,
-            headers=(
-                {
-                    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/44.0.2403.157 Safari/537.36",
-                    "Accept-Language": "en-US, en;q=0.5",
-                }
-            ),
-        )
-        soup = BeautifulSoup(page.content, "html.parser")
-        self.__soup = soup
+        with self.__stats.timer("fetch"):
+            if self.__cache is not None:
+                page = self.__cache.fetch(self.__transport, URL)
+            else:
+                page = self.__transport.get(URL)
+        self.__stats.record_fetch(page)
+        if not page.ok:
+            raise FetchError(page)
+        soup = self.parse_page(page.content)
         print(f"Website scraping finished!")
         return soup
 
+    def parse_page(self, content: bytes) -> BeautifulSoup:
+        """
+        Parses downloaded html code of a page with the parser backend chosen in init method and returns a soup object.
+
+        Parameters:
+            * content(bytes): html code of en.autoplius.lt listing page.
+
+        Returns:
+            * soup(BeautifulSoup): BeautifulSoup object, which contains html code. The object becomes an attribute of init method.
+        """
+        with self.__stats.timer("parse"):
+            soup = parse_listing(content, self.__parser, self.__only_announcements)
+        self.__soup = soup
+        return soup
+
     def find_announcements(self) -> BeautifulSoup:
         """
         Takes the soup object from init method and finds all ads with cars on sale.
@@ -80,13 +155,88 @@ class autoplius_scraper:
             * cars(BeautifulSoup): a BeautifulSoup object with all car sale ads. The object becomes an attribute of init method.
         """
         soup = self.__soup
-        cars = soup.find_all("a", class_="announcement-item")
+        with self.__stats.timer("find_announcements"):
+            cars = soup.find_all("a", class_="announcement-item")
         self.__cars = cars
+        self.__records = None
+        self.__normalized = None
+        self.__page_keyed = False
         return cars
 
+    def extract_records(self) -> list:
+        """
+        Takes cars soup instance from init method and extracts the raw text of every car attribute from each advertisement in a single pass.
+        The result is kept for the current page, so the scrape_* methods are views over it instead of separate passes.
+
+        Parameters:
+            * None
+
+        Returns:
+            * records(list): a list of raw record tuples ordered as extractor.COLUMNS.
+        """
+        if self.__records is None:
+            with self.__stats.timer("extract"):
+                self.__records = extractor.extract_all(self.__cars)
+        return self.__records
+
+    def __page_normalized(self) -> Normalized:
+        if self.__normalized is None:
+            records = self.extract_records()
+            with self.__stats.timer("normalize"):
+                self.__normalized = normalize_records(records)
+        return self.__normalized
+
+    def __page_column(self, column: str) -> list:
+        normalized = self.__page_normalized()
+        # The scrape_* views fill one attribute each; the ad IDs and links of the page are appended once, by the first view
+        # called, so that every column buffer stays as long as the others.
+        if not self.__page_keyed:
+            self.__page_keyed = True
+            self.__columns.extend("AdId", normalized.frame["AdId"].tolist())
+            self.__links.update(_links(self.extract_records(), normalized.frame["AdId"], self.__base_url))
+        return normalized.frame[column].tolist()
+
+    def scrape_records(self) -> list:
+        """
+        Extracts all car attributes of the current page at once, normalizes them in one batch and appends them to the column buffers of init method.
+
+        Parameters:
+            * None
+
+        Returns:
+            * page(pd.DataFrame): normalized car attributes of the current page with the columns of into_pandas().
+        """
+        normalized = self.__page_normalized()
+        self.__links.update(_links(self.extract_records(), normalized.frame["AdId"], self.__base_url))
+        self.__append(normalized)
+        return normalized.frame
+
+    def __append(self, normalized: Normalized):
+        if len(normalized.failures):
+            failures = normalized.failures.copy()
+            failures["row"] += len(self.__columns)
+            self.__failures.append(failures)
+        with self.__stats.timer("build"):
+            self.__columns.extend_frame(normalized.frame)
+
+    def failures(self) -> pd.DataFrame:
+        """
+        Reports the values which could not be filled during normalization of the scraped pages.
+
+        Parameters:
+            * None
+
+        Returns:
+            * failures(pd.DataFrame): one row per missing value with row (position in into_pandas()), column,
+              reason ("missing" when the advert has no such field, "unparsed" when its text could not be parsed) and raw text.
+        """
+        if not self.__failures:
+            return pd.DataFrame({"row": [], "column": [], "reason": [], "raw": []})
+        return pd.concat(self.__failures, ignore_index=True)
+
     def scrape_marques(self) -> list:
         """
-        Takes cars soup instance from init method, extracts car marques from every advertisement in it and merges the list with self.__marques init method.
+        Takes cars soup instance from init method, extracts car marques from every advertisement in it and appends the list to the Marque column buffer of init method.
 
         Parameters:
             * None
@@ -94,24 +244,13 @@ class autoplius_scraper:
         Returns:
             * marques(list): a list of car marques. The object is appended to an instance of class.
         """
-        cars = self.__cars
-        marques = []
-        for car in cars:
-            try:
-                marque = (
-                    car.find("div", class_="announcement-title")
-                    .text.strip()
-                    .split(",")[0]
-                )
-            except:
-                marque = None
-            marques.append(marque)
-        self.__marques = [*self.__marques, *marques]
+        marques = self.__page_column("Marque")
+        self.__columns.extend("Marque", marques)
         return marques
 
     def scrape_engines(self) -> list:
         """
-        Takes cars soup instance from init method, extracts information about engine size (in liters) from every advertisement in it and merges the list with self.__engines init method.
+        Takes cars soup instance from init method, extracts information about engine size (in liters) from every advertisement in it and appends the list to the Engine_l column buffer of init method.
 
         Parameters:
             * None
@@ -119,25 +258,13 @@ class autoplius_scraper:
         Returns:
             * engines(list): a list of engines from car adverts. The object is appended to an instance of class
         """
-        cars = self.__cars
-        engines = []
-        for car in cars:
-            try:
-                engine = (
-                    car.find("div", class_="announcement-title")
-                    .text.strip()
-                    .split(",")[1]
-                    .split()[0]
-                )
-            except:
-                engine = None
-            engines.append(engine)
-        self.__engines = [*self.__engines, *engines]
+        engines = self.__page_column("Engine_l")
+        self.__columns.extend("Engine_l", engines)
         return engines
 
     def scrape_carTypes(self) -> list:
         """
-        Takes cars soup instance from init method, extracts information about car type from every advertisement and merges the list with self.__carTypes init method.
+        Takes cars soup instance from init method, extracts information about car type from every advertisement and appends the list to the CarType column buffer of init method.
 
         Parameters:
             * None
@@ -145,22 +272,13 @@ class autoplius_scraper:
         Returns:
             * carTypes(list): a list of car types from car adverts. The object is appended to an instance of class.
         """
-        cars = self.__cars
-        carTypes = []
-        for car in cars:
-            try:
-                carType = car.find("div", class_="announcement-title").text.split(",")[
-                    -1
-                ]
-            except:
-                carType = None
-            carTypes.append(carType)
-        self.__carTypes = [*self.__carTypes, *carTypes]
+        carTypes = self.__page_column("CarType")
+        self.__columns.extend("CarType", carTypes)
         return carTypes
 
     def scrape_years(self) -> list:
         """
-        Takes cars soup instance from init method, extracts information about car manufacturing date from every advertisement and merges the list with self.__years init method.
+        Takes cars soup instance from init method, extracts information about car manufacturing date from every advertisement and appends the list to the ManufacturingDate column buffer of init method.
 
         Parameters:
             * None
@@ -168,24 +286,13 @@ class autoplius_scraper:
         Returns:
             * years(list): a list of car manufacturing dates from car adverts. The object is appended to an instance of class.
         """
-        cars = self.__cars
-        years = []
-        for car in cars:
-            try:
-                year = (
-                    car.find("span", attrs={"title": "Date of manufacture"})
-                    .text.strip()
-                    .split("-")[0]
-                )
-            except:
-                year = None
-            years.append(year)
-        self.__years = [*self.__years, *years]
+        years = self.__page_column("ManufacturingDate")
+        self.__columns.extend("ManufacturingDate", years)
         return years
 
     def scrape_fuels(self) -> list:
         """
-        Takes cars soup instance from init method, extracts information about the type of fuel used in car from every advertisement and merges the list with self.__fuels init method.
+        Takes cars soup instance from init method, extracts information about the type of fuel used in car from every advertisement and appends the list to the FuelType column buffer of init method.
 
         Parameters:
             * None
@@ -193,20 +300,13 @@ class autoplius_scraper:
         Returns:
             * fuels(list): a list of types of fuel used in each car from car adverts. The object is appended to an instance of class.
         """
-        cars = self.__cars
-        fuels = []
-        for car in cars:
-            try:
-                fuel = car.find("span", attrs={"title": "Fuel type"}).text.strip()
-            except:
-                fuel = None
-            fuels.append(fuel)
-        self.__fuels = [*self.__fuels, *fuels]
+        fuels = self.__page_column("FuelType")
+        self.__columns.extend("FuelType", fuels)
         return fuels
 
     def scrape_gearboxes(self) -> list:
         """
-        Takes cars soup instance from init method, extracts information about car's gearbox type from every advertisement and merges the list with self.__gearboxes init method.
+        Takes cars soup instance from init method, extracts information about car's gearbox type from every advertisement and appends the list to the Gearbox column buffer of init method.
 
         Parameters:
             * None
@@ -214,20 +314,13 @@ class autoplius_scraper:
         Returns:
             * gearboxes(list): a list of car gearboxes from car adverts. The object is appended to an instance of class.
         """
-        cars = self.__cars
-        gearboxes = []
-        for car in cars:
-            try:
-                gearbox = car.find("span", attrs={"title": "Gearbox"}).text.strip()
-            except:
-                gearbox = None
-            gearboxes.append(gearbox)
-        self.__gearboxes = [*self.__gearboxes, *gearboxes]
+        gearboxes = self.__page_column("Gearbox")
+        self.__columns.extend("Gearbox", gearboxes)
         return gearboxes
 
     def scrape_powers(self) -> list:
         """
-        Takes cars soup instance from init method, extracts information about car's engine power (in kW) from every advertisement and merges the list with self.__powers init method.
+        Takes cars soup instance from init method, extracts information about car's engine power (in kW) from every advertisement and appends the list to the Power_kW column buffer of init method.
 
         Parameters:
             * None
@@ -235,22 +328,13 @@ class autoplius_scraper:
         Returns:
             * powers(list): a list with engine power from car adverts. The object is appended to an instance of class.
         """
-        cars = self.__cars
-        powers = []
-        for car in cars:
-            try:
-                power = (
-                    car.find("span", attrs={"title": "Power"}).text.strip().split()[0]
-                )
-            except:
-                power = None
-            powers.append(power)
-        self.__powers = [*self.__powers, *powers]
+        powers = self.__page_column("Power_kW")
+        self.__columns.extend("Power_kW", powers)
         return powers
 
     def scrape_mileages(self) -> list:
         """
-        Takes cars soup instance from init method, extracts information about car's mileage (in km) from every advertisement and merges the list with self.__mileages init method.
+        Takes cars soup instance from init method, extracts information about car's mileage (in km) from every advertisement and appends the list to the Mileage_km column buffer of init method.
 
         Parameters:
             * None
@@ -258,25 +342,13 @@ class autoplius_scraper:
         Returns:
             * mileages(list): a list of mileages from car adverts. The object is appended to an instance of class.
         """
-        cars = self.__cars
-        mileages = []
-        for car in cars:
-            try:
-                mileage = (
-                    car.find("span", attrs={"title": "Mileage"})
-                    .text.replace(" km", "")
-                    .replace(" ", "")
-                    .strip()
-                )
-            except:
-                mileage = None
-            mileages.append(mileage)
-        self.__mileages = [*self.__mileages, *mileages]
+        mileages = self.__page_column("Mileage_km")
+        self.__columns.extend("Mileage_km", mileages)
         return mileages
 
     def scrape_prices(self) -> list:
         """
-        Takes cars soup instance from init method, extracts information about car's price (in euros) from every advertisement and merges the list with self.__prices init method.
+        Takes cars soup instance from init method, extracts information about car's price (in euros) from every advertisement and appends the list to the Price_euro column buffer of init method.
 
         Parameters:
             * None
@@ -284,56 +356,28 @@ class autoplius_scraper:
         Returns:
             * mileages(list): a list of prices from car adverts. The object is appended to an instance of class.
         """
-        cars = self.__cars
-        prices = []
-        for car in cars:
-            try:
-                price = (
-                    car.find("div", attrs={"class": "announcement-pricing-info"})
-                    .text.strip()
-                    .replace(" €", "")
-                    .replace(" ", "")
-                    .split()[0]
-                )
-            except:
-                price = None
-            prices.append(price)
-        self.__prices = [*self.__prices, *prices]
+        prices = self.__page_column("Price_euro")
+        self.__columns.extend("Price_euro", prices)
         return prices
 
     def into_pandas(self) -> pd.DataFrame:
         """
-        Takes lists of car attributes (marque, car type, type of fuel and gearbox, manufacturing date, size of engines, engine power, mileage and price)
-        from class init method and inserts them into a single pandas DataFrame.
+        Takes the column buffers of car attributes (marque, car type, type of fuel and gearbox, manufacturing date, size of engines, engine power, mileage and price)
+        from class init method and wraps them into a single pandas DataFrame without copying. Marque, car type, fuel and gearbox are categorical columns,
+        engine size is Float64 and the remaining attributes are Int64; values which are not numbers become missing. The columns are
+        read-only views of the buffers, so call copy() on the result before editing its values.
+        After enrich_details(), the detail page attributes (see function.enrich.DETAIL_COLUMNS) are merged in on AdId.
 
         Parameters:
-            * The following init methods:
-                self.__marques,
-                self.__engines,
-                self.__carTypes,
-                self.__years,
-                self.__fuels,
-                self.__gearboxes,
-                self.__powers,
-                self.__mileages,
-                self.__prices
+            * self.__columns(ColumnBuffers): the column buffers of init method
 
         Returns:
             * results(pd.DataFrame): a dataframe with car attributes scraped from ads in en.autoplius.lt.
         """
-        result = pd.DataFrame(
-            {
-                "Marque": self.__marques,
-                "CarType": self.__carTypes,
-                "FuelType": self.__fuels,
-                "Gearbox": self.__gearboxes,
-                "ManufacturingDate": self.__years,
-                "Engine_l": self.__engines,
-                "Power_kW": self.__powers,
-                "Mileage_km": self.__mileages,
-                "Price_euro": self.__prices,
-            }
-        )
+        with self.__stats.timer("build"):
+            result = self.__columns.to_pandas()
+            if self.__enricher is not None and len(self.__enricher):
+                result = result.merge(self.__enricher.frame(), on="AdId", how="left")
         self.__result = result
         return result
 
@@ -353,43 +397,495 @@ class autoplius_scraper:
 
         return "Pandas dataframe has been successfully exported to the directory as autoplius.csv"
 
-    def multiple_scrapes(self, sample_size: int):
+    def into_sqlite(self, path: str = "autoplius.db") -> str:
+        """
+        Takes pandas dataframe from results object in init method and upserts it into a SQLite database keyed on the ad ID.
+        Unlike into_csv(), earlier runs are kept: adverts are updated in place and their price and mileage changes are kept in the
+        ad_history table with the times they were first and last seen (see function.sinks.SqliteSink).
+
+        Parameters:
+            * path(str): the database file.
+
+        Returns:
+            * informational message about successfully exported dataframe.
+        """
+        with SqliteSink(path) as sink:
+            sink.write(self.__result)
+        return f"Pandas dataframe has been successfully exported to the SQLite database {path}"
+
+    def into_delta(
+        self,
+        snapshot: str = "autoplius_snapshot.csv",
+        delta: str = "autoplius_delta.csv",
+        track_removed: bool = True,
+    ) -> str:
+        """
+        Compares pandas dataframe from results object in init method with the snapshot stored by the previous run and exports the
+        added, removed and changed adverts (price drops and rises, mileage updates) to a compact delta file. The comparison is one
+        join on the ad ID (see function.diff.diff_snapshots), and the current results are stored as the next snapshot.
+
+        Parameters:
+            * snapshot(str): the stored snapshot (.csv, .parquet or .feather); the first run reports every advert as added.
+            * delta(str): the delta file (.csv or .parquet) with a change column: "added", "removed" or "changed".
+            * track_removed(bool): report adverts missing from this run as removed; turn it off for runs which do not cover
+              the whole catalogue, e.g. a sample_size smaller than the number of adverts. The stored snapshot then keeps the
+              adverts this run missed.
+
+        Returns:
+            * informational message with the number of added, removed and changed adverts.
+        """
+        changes = diff_with_snapshot(self.__result, snapshot, delta, track_removed)
+        return (
+            f"{len(changes.added)} added, {len(changes.removed)} removed and {len(changes.changed)} changed adverts "
+            f"have been exported to {delta}"
+        )
+
+    def into_parquet(
+        self,
+        path: str = "autoplius.parquet",
+        partition: bool = False,
+        compression: str = "zstd",
+    ) -> str:
+        """
+        Takes pandas dataframe from results object in init method and exports it to the columnar Parquet format (requires pyarrow).
+
+        Parameters:
+            * path(str): the .parquet file or, with partition, the dataset directory.
+            * partition(bool): write a dataset partitioned by scrape date and marque; every export adds new files next to
+              the partitions written before instead of rewriting them.
+            * compression(str): Parquet compression codec, e.g. "zstd", "snappy" or "gzip".
+
+        Returns:
+            * informational message about successfully exported dataframe.
+        """
+        return self.__into_columnar(path, "parquet", partition, compression)
+
+    def into_feather(
+        self,
+        path: str = "autoplius.feather",
+        partition: bool = False,
+        compression: str = "zstd",
+    ) -> str:
+        """
+        Takes pandas dataframe from results object in init method and exports it to the Arrow Feather format (requires pyarrow).
+
+        Parameters:
+            * path(str): the .feather file or, with partition, the dataset directory.
+            * partition(bool): write a dataset partitioned by scrape date and marque, appending new files to existing partitions.
+            * compression(str): Feather compression codec, "zstd", "lz4" or "uncompressed".
+
+        Returns:
+            * informational message about successfully exported dataframe.
+        """
+        return self.__into_columnar(path, "feather", partition, compression)
+
+    def __into_columnar(self, path: str, format: str, partition: bool, compression: str) -> str:
+        result = self.__result
+        if partition:
+            write_dataset(result, path, format, compression=compression)
+            return f"Pandas dataframe has been successfully exported to the {format} dataset {path}"
+        if format == "parquet":
+            result.to_parquet(path, index=False, compression=compression)
+        else:
+            result.reset_index(drop=True).to_feather(path, compression=compression)
+        return f"Pandas dataframe has been successfully exported to the directory as {path}"
+
+    def multiple_scrapes(
+        self,
+        sample_size: int,
+        concurrency: int = 1,
+        rate: float = None,
+        processes: int = None,
+        incremental: bool = False,
+        checkpoint: Checkpoint = None,
+        resume: bool = False,
+        enrich: bool = False,
+        query: ListingQuery = None,
+    ):
         """
         Collects the required number of car attributes by scraping en.autoplius.lt website. Firstly, the requested sample size is converted
         into the number of website pages to be scraped. Then, for each iteration the website is scraped using scrape_page() and
         find_announcements() methods as well as information about car attributes is collected. Finally, the information is stored in init method objects.
-        After each scraped webpage, the function sleeps for an interval of 2 to 10 seconds.
+        Pages are fetched on a thread pool sharing one keep-alive session, at most concurrency at a time, and processed in page order.
+        Requests are paced by the adaptive throttle of init method, which speeds up while the server answers quickly and backs off on
+        429/5xx responses, errors, rising latency and Retry-After; a fixed rate can be set instead. Pages replayed from the cache are not paced.
+        With processes set, the crawl is pipelined: raw pages are downloaded on the I/O threads, parsed and extracted on a pool of
+        worker processes, and only the compact record batches are sent back and accumulated in page order.
+        Adverts whose ID is already in the seen index of init method are dropped; the new IDs are saved to the index when the crawl completes.
 
         Parameters:
             * sample_size(int): the required number of car attributes
+            * concurrency(int): the maximum number of pages downloaded at the same time
+            * rate(float): a fixed number of requests started per second across all threads (None uses the adaptive throttle)
+            * processes(int): the number of worker processes used for parsing and extraction (None keeps them in this process)
+            * incremental(bool): stop paging at the first page which contains only adverts already in the seen index
+            * checkpoint(Checkpoint): save the page cursor and the collected data every checkpoint.every pages and when the crawl fails;
+              the checkpoint is removed once the crawl completes
+            * resume(bool): restore the data of init method from the checkpoint, retry the pages which had failed and continue after
+              its last completed page
+            * enrich(bool): follow the links of the collected adverts to their detail pages with enrich_details() once the crawl completes
+            * query(ListingQuery): crawl a filtered listing, e.g. ListingQuery().make(43).price(2000, 5000), instead of all used cars
 
         Returns:
-            * The following init methods:
-                self.__marques,
-                self.__engines,
-                self.__carTypes,
-                self.__years,
-                self.__fuels,
-                self.__gearboxes,
-                self.__powers,
-                self.__mileages,
-                self.__prices
+            * self.__columns(ColumnBuffers): the column buffers of init method with the scraped car attributes appended
         """
 
-        self.getPageNo(sample_size)
-        for i in range(1, self.__page_no + 1):
-            URL = f"https://en.autoplius.lt/ads/used-cars?page_nr={i}"
-            self.scrape_page(URL)
-            self.find_announcements()
-            self.scrape_marques()
-            self.scrape_engines()
-            self.scrape_carTypes()
-            self.scrape_years()
-            self.scrape_fuels()
-            self.scrape_gearboxes()
-            self.scrape_powers()
-            self.scrape_mileages()
-            self.scrape_prices()
-            sleep(randint(2, 10))
+        completed = 0
+        if resume and checkpoint is not None:
+            completed = self.__restore(checkpoint)
+        pages = self.__iter_normalized(
+            sample_size, concurrency, rate, processes, incremental, completed + 1, query
+        )
+        try:
+            if resume:
+                self.__retry_failed(concurrency, rate, processes)
+            for i, (normalized, links) in enumerate(pages, start=completed + 1):
+                self.__links.update(links)
+                self.__append(normalized)
+                completed = i
+                print(f"Iteration {i} completed")
+                if checkpoint is not None and i % checkpoint.every == 0:
+                    self.__save(checkpoint, completed)
+        except BaseException:
+            if checkpoint is not None:
+                self.__save(checkpoint, completed)
+                print(f"Crawl interrupted, {completed} completed pages saved to {checkpoint.path}")
+            raise
+        self.__seen.flush()
+        if checkpoint is not None:
+            checkpoint.clear()
+        print(f"Scraping completed, effective rate {self.effective_rate()} requests/s")
+        if enrich:
+            self.enrich_details()
+
+    def crawl_partitions(self, queries: list, sample_size: int, workers: int = 4, **options):
+        """
+        Crawls disjoint slices of the listing in parallel and merges them into init method objects without duplicates. Every slice is
+        crawled by its own scraper sharing the transport, throttle, cache and statistics of this one, so the request budget stays global.
+        Slices are merged in the order of queries, and adverts which are already in the seen index, e.g. because their price changed
+        during the crawl and moved them to another slice, are dropped.
+
+        Parameters:
+            * queries(list): ListingQuery slices, e.g. ListingQuery().split_price() or ListingQuery().split_makes(make_ids)
+            * sample_size(int): the maximum number of car attributes per slice; a slice also ends at its first page without adverts
+            * workers(int): the number of slices crawled at the same time
+            * options: further multiple_scrapes() parameters such as concurrency, rate or processes; rate is one budget
+              shared by all slices
+
+        Returns:
+            * None
+        """
+        options = dict(options)
+        rate = options.pop("rate", None)
+        transport = self.__transport if rate is None else self.__transport.with_limiter(RateLimiter(rate))
+        self.__limiter = transport.limiter
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self.__crawl_partition, query, sample_size, transport, options) for query in queries
+            ]
+            for query, future in zip(queries, futures):
+                self.__merge(future.result())
+                print(f"Partition {query} merged")
+        self.__seen.flush()
+        print(f"Partitioned crawl completed, {len(self.__columns)} adverts collected")
+
+    def __crawl_partition(
+        self, query: ListingQuery, sample_size: int, transport: Transport, options: dict
+    ) -> "autoplius_scraper":
+        partition = autoplius_scraper(
+            self.__parser,
+            self.__only_announcements,
+            self.__cache,
+            throttle=self.__throttle,
+            transport=transport,
+            stats=self.__stats,
+            base_url=self.__base_url,
+        )
+        partition.multiple_scrapes(sample_size, query=query, **options)
+        return partition
+
+    def __merge(self, partition: "autoplius_scraper"):
+        frame = partition.__columns.to_pandas()
+        new = self.__seen.admit(frame["AdId"])
+        self.__append(select_rows(Normalized(frame, partition.failures()), new))
+        kept = set(frame["AdId"][new].dropna().astype(int))
+        self.__links.update(
+            (ad_id, link) for ad_id, link in partition.__links.items() if ad_id in kept
+        )
+        self.__failed_pages.extend(partition.__failed_pages)
+
+    def enrich_details(self) -> pd.DataFrame:
+        """
+        Follows the links of the collected adverts to their detail pages and collects colour, defects, location, VIN and the other
+        attributes of function.enrich.DETAIL_COLUMNS. Detail pages are fetched concurrently with a request budget per host and through
+        the response cache of init method; adverts which have already been enriched are skipped, so the method can be called after
+        every crawl. The attributes are merged into into_pandas() on AdId.
+
+        Parameters:
+            * None
+
+        Returns:
+            * details(pd.DataFrame): the detail attributes of all enriched adverts with an AdId column.
+        """
+        if self.__enricher is None:
+            self.__enricher = DetailEnricher(self.__transport, self.__cache)
+        print(f"Enriching {len(self.__links)} adverts from their detail pages")
+        enriched = self.__enricher.enrich(self.__links)
+        print(f"Enrichment completed, {enriched} adverts enriched, {len(self.__enricher.failed)} failed")
+        return self.__enricher.frame()
+
+    def effective_rate(self) -> float:
+        """
+        Reports the request rate the last crawl of init method has actually achieved, paced by the adaptive throttle or by
+        the fixed rate it was given.
+
+        Parameters:
+            * None
+
+        Returns:
+            * rate(float): completed requests per second, None before at least two requests were made.
+        """
+        return getattr(self.__limiter, "effective_rate", None)
+
+    def market_index(self) -> MarketIndex:
+        """
+        Builds an indexed query layer over pandas dataframe from results object in init method, e.g. the median price by marque and
+        year is market_index().stats(marque="BMW 530", year=2010)["median"] instead of a groupby over the whole dataframe.
+
+        Parameters:
+            * self.__result(pd.DataFrame) object
+
+        Returns:
+            * market(MarketIndex): count, mean, median, min and max price and mileage by marque, year, fuel and gearbox.
+        """
+        return MarketIndex.from_frame(self.__result)
+
+    def crawl_stats(self) -> CrawlStats:
+        """
+        Returns the instrumentation of init method: wall and CPU time per stage (fetch, parse, find_announcements, extract,
+        normalize, build), bytes downloaded, adverts per page, per-field extraction failures and the cache hit rate.
+        Use as_dict() or to_prometheus() to export it. With processes set, parsing and extraction run in the worker processes
+        and are not included in the stage times.
+
+        Parameters:
+            * None
+
+        Returns:
+            * stats(CrawlStats): the crawl statistics collected so far.
+        """
+        return self.__stats
+
+    def failed_pages(self) -> pd.DataFrame:
+        """
+        Reports the pages which crawls skipped because they could not be downloaded after all retries.
+
+        Parameters:
+            * None
+
+        Returns:
+            * failed(pd.DataFrame): one row per skipped page with url, status (None for timeouts and connection errors),
+              error and attempts columns.
+        """
+        return pd.DataFrame(self.__failed_pages, columns=["url", "status", "error", "attempts"])
+
+    def __save(self, checkpoint: Checkpoint, completed: int):
+        checkpoint.save(
+            {
+                "completed": completed,
+                "columns": self.__columns,
+                "failures": self.__failures,
+                "seen": self.__seen.pending(),
+                "links": self.__links,
+                "failed_pages": self.__failed_pages,
+            }
+        )
+
+    def __restore(self, checkpoint: Checkpoint) -> int:
+        state = checkpoint.load()
+        if state is None:
+            return 0
+        self.__columns = state["columns"]
+        self.__failures = state["failures"]
+        self.__seen.admit(state["seen"])
+        self.__links = state.get("links", {})
+        self.__failed_pages = state.get("failed_pages", [])
+        print(f"Resuming after page {state['completed']} from {checkpoint.path}")
+        return state["completed"]
+
+    def iter_pages(
+        self,
+        sample_size: int,
+        concurrency: int = 1,
+        rate: float = None,
+        processes: int = None,
+        incremental: bool = False,
+        query: ListingQuery = None,
+        first_page: int = 1,
+    ):
+        """
+        Streaming version of multiple_scrapes(): scrapes the same pages with the same options, but yields the records of every page
+        as soon as it is processed instead of storing them in init method objects. Peak memory is therefore one page worth of data
+        regardless of sample_size, and the batches can be appended to sinks (see function.sinks) as they arrive.
+
+        Parameters:
+            * sample_size(int): the required number of car attributes
+            * concurrency(int): the maximum number of pages downloaded at the same time
+            * rate(float): a fixed number of requests started per second across all threads (None uses the adaptive throttle)
+            * processes(int): the number of worker processes used for parsing and extraction
+            * incremental(bool): stop paging at the first page which contains only adverts already in the seen index
+            * query(ListingQuery): crawl a filtered listing instead of all used cars
+            * first_page(int): the first page to scrape, e.g. to crawl the page range of a shard (see function.distributed)
+
+        Returns:
+            * generator of pd.DataFrame batches, one per scraped page, with the columns and dtypes of into_pandas().
+        """
+        for i, (normalized, _) in enumerate(
+            self.__iter_normalized(
+                sample_size, concurrency, rate, processes, incremental, first_page, query
+            ),
+            start=first_page,
+        ):
+            yield normalized.frame
+            self.__seen.flush()
             print(f"Iteration {i} completed")
         print("Scraping completed")
+
+    def iter_records(self, sample_size: int, **options):
+        """
+        Yields the scraped adverts one by one as dicts keyed by the columns of into_pandas(). Takes the same parameters as iter_pages().
+        """
+        for batch in self.iter_pages(sample_size, **options):
+            yield from batch.to_dict("records")
+
+    def __iter_normalized(
+        self,
+        sample_size: int,
+        concurrency: int,
+        rate: float,
+        processes: int,
+        incremental: bool,
+        first_page: int = 1,
+        query: ListingQuery = None,
+    ):
+        for page, records in enumerate(
+            self.__iter_page_records(sample_size, concurrency, rate, processes, first_page, query),
+            start=first_page,
+        ):
+            if records is None:
+                # the page failed to download and is listed by failed_pages(); it is not counted as a completed page
+                normalized = normalize_records([])
+                new = self.__seen.admit(normalized.frame["AdId"])
+            elif not records:
+                print(f"Page {page} has no adverts, the end of the listing has been reached")
+                return
+            else:
+                normalized, new = self.__admit(page, records)
+                if incremental and not new.any():
+                    print("Only already seen adverts found, stopping the incremental crawl")
+                    return
+            yield select_rows(normalized, new), _links(records, normalized.frame["AdId"], self.__base_url, new)
+
+    def __admit(self, page: int, records: list) -> tuple:
+        with self.__stats.timer("normalize"):
+            normalized = normalize_records(records)
+        self.__stats.record_page(page, len(records), normalized.failures)
+        return normalized, self.__seen.admit(normalized.frame["AdId"])
+
+    def __retry_failed(self, concurrency: int, rate: float, processes: int):
+        # Pages which failed before a checkpoint was saved are fetched again when the crawl resumes; those failing again stay
+        # in failed_pages(), and so do the ones not retried yet if the crawl is interrupted once more.
+        remaining, self.__failed_pages = self.__failed_pages, []
+        failed = list(remaining)
+        URLs, numbers = [entry["url"] for entry in failed], [entry.get("page") for entry in failed]
+        try:
+            for records, page in zip(self.__iter_records(URLs, numbers, concurrency, rate, processes), numbers):
+                remaining.pop(0)
+                if records is None:
+                    continue
+                normalized, new = self.__admit(page, records)
+                self.__links.update(_links(records, normalized.frame["AdId"], self.__base_url, new))
+                self.__append(select_rows(normalized, new))
+                print(f"Page {page} retried")
+        finally:
+            self.__failed_pages = remaining + self.__failed_pages
+
+    def __iter_page_records(
+        self,
+        sample_size: int,
+        concurrency: int,
+        rate: float,
+        processes: int,
+        first_page: int = 1,
+        query: ListingQuery = None,
+    ):
+        self.getPageNo(sample_size)
+        query = query if query is not None else ListingQuery(self.__base_url)
+        numbers = range(first_page, self.__page_no + 1)
+        yield from self.__iter_records([query.url(i) for i in numbers], numbers, concurrency, rate, processes)
+
+    def __iter_records(self, URLs: list, numbers, concurrency: int, rate: float, processes: int):
+        transport = self.__transport if rate is None else self.__transport.with_limiter(RateLimiter(rate))
+        self.__limiter = transport.limiter
+        pages = self.__skip_failed(
+            fetch_pages(URLs, transport, concurrency, self.__cache, self.__stats), numbers
+        )
+        if processes:
+            yield from self.__pipelined_records(pages, processes)
+            return
+        for URL, page in pages:
+            if page is None:
+                yield None
+                continue
+            self.parse_page(page.content)
+            self.find_announcements()
+            yield self.extract_records()
+
+    def __skip_failed(self, pages, numbers):
+        # A page that failed after all retries is reported and replaced by None, so page numbers stay aligned.
+        for (URL, page), number in zip(pages, numbers):
+            if not page.ok:
+                print(f"Skipping {URL}: {page.error or f'HTTP {page.status_code}'}")
+                self.__failed_pages.append(
+                    {
+                        "url": URL,
+                        "status": page.status_code,
+                        "error": page.error,
+                        "attempts": getattr(page, "attempts", 1),
+                        "page": number,
+                    }
+                )
+                page = None
+            yield URL, page
+
+    def __pipelined_records(self, pages, processes: int):
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            pending = deque()
+            for URL, page in pages:
+                pending.append(
+                    None
+                    if page is None
+                    else pool.submit(
+                        extract_page, page.content, self.__parser, self.__only_announcements
+                    )
+                )
+                while len(pending) > 2 * processes or (
+                    pending and (pending[0] is None or pending[0].done())
+                ):
+                    yield _records(pending.popleft())
+            while pending:
+                yield _records(pending.popleft())
+
+
+def _links(records: list, ad_ids, base_url: str, keep=None) -> dict:
+    # Detail page links of the adverts, keyed by ad ID; the raw href is not part of the normalized frame. Relative links
+    # are resolved against the crawled website.
+    href = RAW_COLUMNS.index("href")
+    return {
+        int(ad_id): records[position][href] and urljoin(f"{base_url}/", records[position][href])
+        for position, ad_id in enumerate(ad_ids)
+        if not pd.isna(ad_id) and (keep is None or keep[position])
+    }
+
+
+def _records(future) -> list:
+    return None if future is None else future.result()
@@ -0,0 +1,291 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter
+from function.autoplius_scraper import autoplius_scraper
+from function.parsing import available_parsers, parse_listing
+from function.synthetic import synthetic_page
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "fixtures")
+
+SCRAPE_METHODS = (
+    "scrape_marques",
+    "scrape_engines",
+    "scrape_carTypes",
+    "scrape_years",
+    "scrape_fuels",
+    "scrape_gearboxes",
+    "scrape_powers",
+    "scrape_mileages",
+    "scrape_prices",
+)
+
+
+def best_time(function, repeat: int = 5, setup=None) -> float:
+    """
+    Runs function repeat times and returns the best wall time in seconds; setup is called before every run and not timed.
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        function()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def fixture_pages(directory: str = FIXTURES) -> dict:
+    """
+    Loads the captured used-cars?page_nr=N listing pages checked in under test/fixtures.
+
+    Returns:
+        * pages(dict): file name: html code.
+    """
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(directory, "used-cars_page_nr_*.html"))):
+        with open(path, "rb") as f:
+            pages[os.path.basename(path)] = f.read()
+    return pages
+
+
+def bench_parsers(pages: dict, repeat: int = 5) -> list:
+    """
+    Times every installed parser backend, with and without announcement-only parsing, on every page.
+    """
+    results = []
+    for name, content in pages.items():
+        for parser in available_parsers():
+            for only_announcements in (False, True):
+                if only_announcements and parser == "html5lib":
+                    continue
+                results.append(
+                    {
+                        "page": name,
+                        "parser": parser,
+                        "only_announcements": only_announcements,
+                        "seconds": best_time(
+                            lambda: parse_listing(content, parser, only_announcements), repeat
+                        ),
+                    }
+                )
+    return results
+
+
+def bench_stages(content: bytes, parser: str = "html.parser", repeat: int = 5) -> dict:
+    """
+    Times find_announcements(), extract_records() and every scrape_* method on one parsed page. Each scrape_* method
+    is timed cold, i.e. as the first call on the page, which includes the shared extraction and normalization.
+    """
+    scraper = autoplius_scraper(parser=parser)
+    scraper.parse_page(content)
+    ads = len(scraper.find_announcements())
+    results = {
+        "ads": ads,
+        "find_announcements": best_time(scraper.find_announcements, repeat),
+        "extract_records": best_time(scraper.extract_records, repeat, scraper.find_announcements),
+    }
+    for method in SCRAPE_METHODS:
+        results[method] = best_time(getattr(scraper, method), repeat, scraper.find_announcements)
+    results["scrape_records"] = best_time(scraper.scrape_records, repeat, scraper.find_announcements)
+    return results
+
+
+def filled_scraper(ads: int, page_size: int = 500, parser: str = "html.parser") -> autoplius_scraper:
+    """
+    Returns a scraper holding ads synthetic adverts, scraped from pages of page_size adverts.
+    """
+    scraper = autoplius_scraper(parser=parser)
+    for page_no in range(1, -(-ads // page_size) + 1):
+        size = min(page_size, ads - (page_no - 1) * page_size)
+        scraper.parse_page(synthetic_page(size, seed=page_no, first_id=30000000 + (page_no - 1) * page_size))
+        scraper.find_announcements()
+        scraper.scrape_records()
+    return scraper
+
+
+def bench_outputs(ads: int, parser: str = "html.parser", repeat: int = 3) -> dict:
+    """
+    Times into_pandas() and into_csv() for a scraper holding ads synthetic adverts.
+    """
+    scraper = filled_scraper(ads, parser=parser)
+    into_pandas = best_time(scraper.into_pandas, repeat)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # into_csv() writes autoplius.csv to the working directory
+        os.chdir(directory)
+        try:
+            into_csv = best_time(scraper.into_csv, repeat)
+        finally:
+            os.chdir(cwd)
+    return {"ads": ads, "into_pandas": into_pandas, "into_csv": into_csv}
+
+
+def bench_memory(ads: int, page_size: int = 500, parser: str = "html.parser") -> dict:
+    """
+    Measures the peak memory traced by tracemalloc while ads synthetic adverts are scraped page by page and
+    wrapped into a DataFrame with into_pandas().
+    """
+    tracemalloc.start()
+    try:
+        start = perf_counter()
+        scraper = filled_scraper(ads, page_size, parser)
+        frame = scraper.into_pandas()
+        elapsed = perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "ads": ads,
+        "page_size": page_size,
+        "rows": len(frame),
+        "peak_bytes": peak,
+        "retained_bytes": current,
+        "seconds": elapsed,
+    }
+
+
+# Modules whose import is deferred until a crawl needs them, and the cold starts measured by bench_cold_start().
+HEAVY_MODULES = ("pandas", "numpy", "bs4", "requests")
+COLD_STARTS = {
+    "import_scraper": "import function.autoplius_scraper",
+    "cli_help": "import function.cli; function.cli.parser().format_help()",
+}
+
+
+def bench_cold_start(repeat: int = 5) -> dict:
+    """
+    Measures the start-up time of a fresh interpreter which imports the scraper or prints the command line help, and lists
+    the heavy modules loaded by it, which should be none of HEAVY_MODULES.
+
+    Returns:
+        * results(dict): name: {"seconds" (best wall time of the whole process), "heavy_modules"}.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    for name, code in COLD_STARTS.items():
+        report = f"{code}\nimport sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        seconds, loaded = [], ""
+        for _ in range(repeat):
+            start = perf_counter()
+            loaded = subprocess.run(
+                [sys.executable, "-c", report], capture_output=True, text=True, cwd=root, check=True
+            ).stdout.strip()
+            seconds.append(perf_counter() - start)
+        results[name] = {"seconds": min(seconds), "heavy_modules": [module for module in loaded.split(",") if module]}
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(FIXTURES)
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    import bs4
+    import pandas
+
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "bs4": bs4.__version__,
+        "pandas": pandas.__version__,
+        "parsers": available_parsers(),
+    }
+
+
+def run(
+    sizes: tuple = (1000, 10000, 100000),
+    parser: str = None,
+    repeat: int = 5,
+    stage_ads: int = 1000,
+) -> dict:
+    """
+    Runs the whole suite and returns the results as a JSON-serialisable dict.
+
+    Parameters:
+        * sizes(tuple): the numbers of adverts at which output times and peak memory are measured.
+        * parser(str): the parser backend used for the stage, output and memory benchmarks, the fastest installed one by default.
+        * repeat(int): the number of runs per timing; the best one is reported.
+        * stage_ads(int): the number of adverts on the synthetic page used for the stage timings.
+
+    Returns:
+        * results(dict): environment, parsers, stages, outputs, memory and cold_start sections.
+    """
+    parser = parser or available_parsers()[0]
+    pages = fixture_pages()
+    pages[f"synthetic_{stage_ads}"] = synthetic_page(stage_ads)
+    return {
+        "environment": {**environment(), "parser": parser},
+        "parsers": bench_parsers(pages, repeat),
+        "stages": {name: bench_stages(content, parser, repeat) for name, content in pages.items()},
+        "outputs": [bench_outputs(ads, parser, min(repeat, 3)) for ads in sizes],
+        "memory": [bench_memory(ads, parser=parser) for ads in sizes],
+        "cold_start": bench_cold_start(repeat),
+    }
+
+
+def compare(baseline: dict, results: dict) -> list:
+    """
+    Lists the ratio of every timing and peak memory figure to the same figure of a baseline run (above 1 means slower or larger).
+    """
+
+    def figures(results):
+        flat = {}
+        for entry in results["parsers"]:
+            flat[f"parse/{entry['page']}/{entry['parser']}/{entry['only_announcements']}"] = entry["seconds"]
+        for page, stages in results["stages"].items():
+            for stage, value in stages.items():
+                if stage != "ads":
+                    flat[f"stage/{page}/{stage}"] = value
+        for entry in results["outputs"]:
+            flat[f"into_pandas/{entry['ads']}"] = entry["into_pandas"]
+            flat[f"into_csv/{entry['ads']}"] = entry["into_csv"]
+        for entry in results["memory"]:
+            flat[f"peak_bytes/{entry['ads']}"] = entry["peak_bytes"]
+        for name, entry in results.get("cold_start", {}).items():
+            flat[f"cold_start/{name}"] = entry["seconds"]
+        return flat
+
+    old, new = figures(baseline), figures(results)
+    return [
+        {"figure": name, "baseline": old[name], "current": new[name], "ratio": new[name] / old[name] if old[name] else None}
+        for name in new
+        if name in old
+    ]
+
+
+def main(argv: list = None):
+    arguments = argparse.ArgumentParser(
+        description="Benchmarks parsing, extraction, DataFrame build and memory of the autoplius scraper."
+    )
+    arguments.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    arguments.add_argument("--parser", help="parser backend, the fastest installed one by default")
+    arguments.add_argument("--repeat", type=int, default=5)
+    arguments.add_argument("--output", help="write the results to this JSON file instead of stdout")
+    arguments.add_argument("--compare", help="JSON results of a previous run to compare with")
+    options = arguments.parse_args(argv)
+    results = run(tuple(options.sizes), options.parser, options.repeat)
+    if options.compare:
+        with open(options.compare) as f:
+            results["comparison"] = compare(json.load(f), results)
+    text = json.dumps(results, indent=2)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+    return results
+
+
+if __name__ == "__main__":
+    main()
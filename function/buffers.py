@@ -0,0 +1,156 @@
+from __future__ import annotations
+from function.lazy import LazyModule
+from function.normalize import SOURCES
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    # The flag is set on a view, so the buffer itself stays writable for later extend() calls.
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+# Storage type of every column: dictionary-encoded strings ("category") or nullable numbers ("Int64", "Float64").
+COLUMN_TYPES = {name: dtype for name, (_, dtype) in SOURCES.items()}
+
+
+class NumberColumn:
+    """
+    Growable numeric column backed by a NumPy array with amortised doubling and a boolean mask of missing values.
+
+    Parameters:
+        * dtype(str): "Int64" (stored as int64) or "Float64" (stored as float64).
+    """
+
+    def __init__(self, dtype: str = "Int64"):
+        self.dtype = dtype
+        self.__values = np.zeros(64, dtype=np.int64 if dtype == "Int64" else np.float64)
+        self.__mask = np.ones(64, dtype=np.bool_)
+        self.__size = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __reserve(self, extra: int):
+        needed = self.__size + extra
+        capacity = len(self.__values)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        # Growing allocates new arrays, so views handed out by to_pandas() keep pointing at unchanged data.
+        values = np.zeros(capacity, dtype=self.__values.dtype)
+        mask = np.ones(capacity, dtype=np.bool_)
+        values[: self.__size] = self.__values[: self.__size]
+        mask[: self.__size] = self.__mask[: self.__size]
+        self.__values, self.__mask = values, mask
+
+    def extend(self, values):
+        """
+        Appends numbers, e.g. a normalized Int64/Float64 column; None and pd.NA are stored as missing.
+        """
+        values = pd.array(values, dtype=self.dtype)
+        size = len(values)
+        self.__reserve(size)
+        end = self.__size + size
+        self.__values[self.__size : end] = values.to_numpy(dtype=self.__values.dtype, na_value=0)
+        self.__mask[self.__size : end] = values.isna()
+        self.__size = end
+
+    def to_pandas(self):
+        """
+        Returns a nullable pandas array (Int64 or Float64) viewing the stored values without copying them. The view is
+        read-only, so writing to it raises instead of changing the stored data.
+        """
+        values = _read_only(self.__values[: self.__size])
+        mask = _read_only(self.__mask[: self.__size])
+        if self.dtype == "Int64":
+            return pd.arrays.IntegerArray(values, mask)
+        return pd.arrays.FloatingArray(values, mask)
+
+
+class CategoryColumn:
+    """
+    Dictionary-encoded string column: every distinct value is stored once and rows keep int32 codes, -1 meaning missing.
+    """
+
+    def __init__(self):
+        self.categories = []
+        self.__lookup = {}
+        self.__codes = np.full(64, -1, dtype=np.int32)
+        self.__size = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def extend(self, values):
+        """
+        Appends strings, e.g. a normalized categorical column; None and missing values get the code -1.
+        """
+        values = pd.Categorical(values)
+        needed = self.__size + len(values)
+        if needed > len(self.__codes):
+            capacity = len(self.__codes)
+            while capacity < needed:
+                capacity *= 2
+            codes = np.full(capacity, -1, dtype=np.int32)
+            codes[: self.__size] = self.__codes[: self.__size]
+            self.__codes = codes
+        lookup = self.__lookup
+        # Only the distinct values of the batch go through the dictionary; rows are remapped with one take().
+        mapping = np.empty(len(values.categories) + 1, dtype=np.int32)
+        for position, value in enumerate(values.categories):
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(self.categories)
+                self.categories.append(value)
+            mapping[position] = code
+        mapping[-1] = -1
+        self.__codes[self.__size : needed] = mapping[values.codes]
+        self.__size = needed
+
+    def to_pandas(self) -> pd.Categorical:
+        """
+        Returns a pandas Categorical built on a read-only view of the stored codes.
+        """
+        return pd.Categorical.from_codes(
+            _read_only(self.__codes[: self.__size]), categories=self.categories
+        )
+
+
+class ColumnBuffers:
+    """
+    Accumulates scraped records column by column in compact typed buffers: categorical columns are dictionary-encoded
+    and numeric columns are stored as int64/float64 arrays, which avoids holding one Python string per value.
+    """
+
+    def __init__(self, column_types: dict = COLUMN_TYPES):
+        self.columns = {
+            name: CategoryColumn() if dtype == "category" else NumberColumn(dtype)
+            for name, dtype in column_types.items()
+        }
+
+    def __len__(self) -> int:
+        return min((len(column) for column in self.columns.values()), default=0)
+
+    def extend(self, column: str, values):
+        self.columns[column].extend(values)
+
+    def extend_frame(self, frame: pd.DataFrame):
+        """
+        Appends a normalized batch (see function.normalize) column by column.
+        """
+        for name, column in self.columns.items():
+            column.extend(frame[name])
+
+    def to_pandas(self) -> pd.DataFrame:
+        """
+        Builds a DataFrame with Categorical, Int64 and Float64 columns on top of the buffers without copying them. The
+        columns view the buffers read-only: values can be changed on a copy(), never in the buffers themselves.
+        """
+        return pd.DataFrame(
+            {name: column.to_pandas() for name, column in self.columns.items()},
+            copy=False,
+        )
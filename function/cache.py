@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from function.fetch import PageResult
+from function.files import write_atomic
+
+
+class CacheMiss(LookupError):
+    """
+    Raised in offline mode when a URL has never been cached.
+    """
+
+
+# Entry field: (response header, conditional request header) of every validator.
+VALIDATORS = {"etag": ("ETag", "If-None-Match"), "last_modified": ("Last-Modified", "If-Modified-Since")}
+
+
+def _validators(entry: dict, conditional: bool = False) -> dict:
+    # The validators of an entry as response headers, or as the request headers which revalidate it.
+    return {headers[conditional]: entry[field] for field, headers in VALIDATORS.items() if entry.get(field)}
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of raw listing responses. Bodies are stored once under the SHA-256 of their content,
+    while a small JSON entry per URL keeps the body hash, validators (ETag, Last-Modified) and the download time.
+    Fresh entries are served without a request, stale ones are revalidated with If-None-Match/If-Modified-Since and
+    the least recently used entries are evicted once the bodies exceed max_bytes. In offline mode the network is never used.
+
+    Parameters:
+        * directory(str): the cache directory, created when missing.
+        * ttl(float): seconds for which a cached response is served without revalidation.
+        * max_bytes(int): the size limit of stored bodies.
+        * offline(bool): replay cached responses only, regardless of their age, and raise CacheMiss for unknown URLs.
+    """
+
+    def __init__(
+        self,
+        directory: str = ".autoplius_cache",
+        ttl: float = 3600,
+        max_bytes: int = 512 * 1024 * 1024,
+        offline: bool = False,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.__lock = threading.Lock()
+        self.__entries = os.path.join(directory, "entries")
+        self.__bodies = os.path.join(directory, "bodies")
+        os.makedirs(self.__entries, exist_ok=True)
+        os.makedirs(self.__bodies, exist_ok=True)
+        self.__size = sum(
+            os.path.getsize(os.path.join(self.__bodies, name))
+            for name in os.listdir(self.__bodies)
+        )
+
+    def __entry_path(self, url: str) -> str:
+        return os.path.join(self.__entries, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def lookup(self, url: str) -> dict:
+        """
+        Returns the cache entry of the URL or None when it is not cached.
+
+        Parameters:
+            * url(str): website address.
+
+        Returns:
+            * entry(dict): url, body, etag, last_modified and fetched_at of the cached response.
+        """
+        try:
+            with open(self.__entry_path(url)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not os.path.exists(os.path.join(self.__bodies, entry["body"])):
+            return None
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def load(self, entry: dict) -> PageResult:
+        """
+        Reads the body of a cache entry and marks the entry as recently used.
+        """
+        with open(os.path.join(self.__bodies, entry["body"]), "rb") as f:
+            content = f.read()
+        try:
+            os.utime(self.__entry_path(entry["url"]))
+        except FileNotFoundError:
+            pass
+        return PageResult(entry["url"], 200, content, from_cache=True)
+
+    def put(self, url: str, content: bytes, headers: dict = None) -> dict:
+        """
+        Stores a response body for the URL, e.g. a freshly downloaded page or a captured page used for offline replay.
+
+        Parameters:
+            * url(str): website address.
+            * content(bytes): the raw response body.
+            * headers(dict): response headers; ETag and Last-Modified are kept for revalidation.
+
+        Returns:
+            * entry(dict): the stored cache entry.
+        """
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        digest = hashlib.sha256(content).hexdigest()
+        body_path = os.path.join(self.__bodies, digest)
+        entry = {
+            "url": url,
+            "body": digest,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "fetched_at": time.time(),
+        }
+        with self.__lock:
+            if not os.path.exists(body_path):
+                write_atomic(body_path, content)
+                self.__size += len(content)
+            write_atomic(self.__entry_path(url), json.dumps(entry).encode())
+        if self.__size > self.max_bytes:
+            self.evict()
+        return entry
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the stored bodies fit into max_bytes, then deletes unreferenced bodies.
+        """
+        with self.__lock:
+            paths = [os.path.join(self.__entries, name) for name in os.listdir(self.__entries)]
+            entries = []
+            for path in paths:
+                try:
+                    with open(path) as f:
+                        entries.append((os.path.getmtime(path), path, json.load(f)["body"]))
+                except (FileNotFoundError, ValueError):
+                    continue
+            entries.sort()
+            sizes = {}
+            for name in os.listdir(self.__bodies):
+                if not name.startswith(".tmp-"):
+                    sizes[name] = os.path.getsize(os.path.join(self.__bodies, name))
+            referenced = {}
+            for _, _, body in entries:
+                referenced[body] = referenced.get(body, 0) + 1
+            size = sum(sizes.values())
+            for _, path, body in entries:
+                if size <= self.max_bytes:
+                    break
+                os.remove(path)
+                referenced[body] -= 1
+                if not referenced[body] and body in sizes:
+                    os.remove(os.path.join(self.__bodies, body))
+                    size -= sizes.pop(body)
+            for body in list(sizes):
+                if not referenced.get(body):
+                    os.remove(os.path.join(self.__bodies, body))
+                    size -= sizes.pop(body)
+            self.__size = size
+
+    def fetch(self, transport, url: str):
+        """
+        Returns the page at URL, served from the cache when possible.
+
+        Parameters:
+            * transport(Transport): transport used for downloads and revalidation; a requests.Session also works.
+            * url(str): website address.
+
+        Returns:
+            * page(PageResult or requests.Response): an object with url, status_code, content and ok attributes.
+        """
+        entry = self.lookup(url)
+        if entry is not None and (self.offline or self.is_fresh(entry)):
+            self.hits += 1
+            return self.load(entry)
+        if self.offline:
+            self.misses += 1
+            raise CacheMiss(f"{url} is not cached in {self.directory}")
+        headers = _validators(entry, conditional=True) if entry is not None else {}
+        response = transport.get(url, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            page = self.load(entry)
+            self.put(url, page.content, {**_validators(entry), **response.headers})
+            return page
+        self.misses += 1
+        if response.status_code == 200:
+            self.put(url, response.content, response.headers)
+        return response
+
@@ -0,0 +1,34 @@
+import os
+import pickle
+from function.files import write_atomic
+
+
+class Checkpoint:
+    """
+    Periodic snapshot of a multiple_scrapes() run: the number of completed pages together with everything collected
+    from them. Snapshots are pickled and written atomically, so a crash during a save keeps the previous one intact.
+
+    Parameters:
+        * path(str): the checkpoint file.
+        * every(int): the number of completed pages between two snapshots.
+    """
+
+    def __init__(self, path: str = "autoplius.checkpoint", every: int = 10):
+        self.path = path
+        self.every = every
+
+    def save(self, state: dict):
+        write_atomic(self.path, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def load(self) -> dict:
+        """
+        Returns the last saved state or None when there is no checkpoint.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            return pickle.load(f)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,139 @@
+import argparse
+import os
+
+# Output format: default file. pandas, bs4 and the scraper are only imported by the subcommands which need them, so that
+# --help and short jobs start quickly (see benchmark.bench_cold_start).
+FORMATS = {
+    "csv": "autoplius.csv",
+    "parquet": "autoplius.parquet",
+    "feather": "autoplius.feather",
+    "sqlite": "autoplius.db",
+}
+
+
+def _format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lstrip(".")
+    return {"db": "sqlite", "sqlite3": "sqlite"}.get(extension, extension if extension in FORMATS else "csv")
+
+
+def _write(frame, format: str, path: str) -> str:
+    """
+    Writes a DataFrame with the columns of into_pandas() to a .csv, .parquet or .feather file or upserts it into a SQLite database.
+    """
+    if format == "sqlite":
+        from function.sinks import SqliteSink
+
+        with SqliteSink(path) as sink:
+            sink.write(frame)
+    elif format == "parquet":
+        frame.to_parquet(path, index=False, compression="zstd")
+    elif format == "feather":
+        frame.reset_index(drop=True).to_feather(path, compression="zstd")
+    else:
+        frame.to_csv(path, index=False)
+    return f"{len(frame)} adverts have been exported to {path}"
+
+
+def _scraper(options):
+    from function.autoplius_scraper import autoplius_scraper
+    from function.cache import ResponseCache
+    from function.enrich import DetailEnricher
+    from function.seen import SeenIndex
+
+    cache = ResponseCache(options.cache_dir) if options.cache_dir else None
+    return autoplius_scraper(
+        parser=options.parser,
+        only_announcements=True,
+        cache=cache,
+        seen=SeenIndex(options.seen) if options.seen else None,
+        base_url=options.base_url,
+        enricher=DetailEnricher(cache=cache) if options.enrich else None,
+    )
+
+
+def crawl(options, resume: bool = False) -> str:
+    from function.checkpoint import Checkpoint
+
+    scraper = _scraper(options)
+    checkpoint = Checkpoint(options.checkpoint)
+    scraper.multiple_scrapes(
+        options.sample_size,
+        concurrency=options.concurrency,
+        rate=options.rate,
+        processes=options.processes,
+        incremental=options.incremental,
+        checkpoint=checkpoint,
+        resume=resume,
+        enrich=options.enrich,
+    )
+    output = options.output or FORMATS[options.format]
+    return _write(scraper.into_pandas(), options.format, output)
+
+
+def export(options) -> str:
+    from function.diff import read_snapshot
+
+    output = options.output or FORMATS[options.format]
+    return _write(read_snapshot(options.input), options.format, output)
+
+
+def parser() -> argparse.ArgumentParser:
+    arguments = argparse.ArgumentParser(prog="autoplius-scraper", description="Scrapes used car adverts from en.autoplius.lt.")
+    commands = arguments.add_subparsers(dest="command", required=True)
+    for name, help in (
+        ("crawl", "crawl the listing and export the adverts"),
+        ("resume", "continue an interrupted crawl from its checkpoint"),
+    ):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("sample_size", type=int, help="the number of adverts to collect")
+        command.add_argument("--concurrency", type=int, default=4, help="the number of pages downloaded at the same time")
+        command.add_argument("--rate", type=float, help="a fixed number of requests per second instead of the adaptive throttle")
+        command.add_argument("--processes", type=int, help="the number of worker processes used for parsing")
+        command.add_argument("--format", choices=tuple(FORMATS), help="csv by default, or guessed from --output")
+        command.add_argument("--output", help="the output file, autoplius.<format> by default")
+        command.add_argument("--cache-dir", help="directory of the response cache; no cache by default")
+        command.add_argument(
+            "--checkpoint", default="autoplius.checkpoint", help="saved every 10 pages and removed once the crawl completes"
+        )
+        command.add_argument("--parser", default="html.parser", help="BeautifulSoup tree builder, e.g. lxml")
+        command.add_argument("--base-url", default="https://en.autoplius.lt")
+        command.add_argument("--seen", help="file of the ad IDs collected by earlier runs; their adverts are skipped")
+        command.add_argument(
+            "--incremental", action="store_true", help="stop at the first page of adverts seen before, requires --seen"
+        )
+        command.add_argument("--enrich", action="store_true", help="also collect the attributes of the detail pages")
+    command = commands.add_parser("export", help="convert the adverts of an earlier crawl to another format")
+    command.add_argument("input", help="a .csv, .parquet or .feather file written by crawl")
+    command.add_argument("--format", choices=tuple(FORMATS), help="csv by default, or guessed from --output")
+    command.add_argument("--output")
+    # The options of benchmark are those of python -m function.benchmark and are passed on as they are.
+    commands.add_parser("benchmark", help="run the benchmark suite, see function.benchmark")
+    return arguments
+
+
+def main(argv: list = None):
+    """
+    Entry point of the autoplius-scraper command, e.g. autoplius-scraper crawl 1000 --concurrency 4 --format parquet.
+    """
+    arguments = parser()
+    options, unknown = arguments.parse_known_args(argv)
+    if unknown and options.command != "benchmark":
+        arguments.error(f"unrecognized arguments: {' '.join(unknown)}")
+    if options.command != "benchmark" and options.format is None:
+        options.format = _format(options.output) if options.output else "csv"
+    if options.command in ("crawl", "resume") and options.incremental and not options.seen:
+        arguments.error("--incremental needs --seen to know the adverts of earlier runs")
+    if options.command == "resume" and not os.path.exists(options.checkpoint):
+        arguments.error(f"no checkpoint to resume from at {options.checkpoint}")
+    if options.command in ("crawl", "resume"):
+        print(crawl(options, resume=options.command == "resume"))
+    elif options.command == "export":
+        print(export(options))
+    else:
+        from function.benchmark import main as benchmark
+
+        benchmark(unknown)
+
+
+if __name__ == "__main__":
+    main()
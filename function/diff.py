@@ -0,0 +1,145 @@
+from __future__ import annotations
+import io
+import os
+from collections import namedtuple
+from function.files import write_atomic
+from function.lazy import LazyModule
+from function.normalize import SOURCES
+
+pd = LazyModule("pandas")
+
+# Attributes whose changes are reported for adverts present in both snapshots.
+TRACKED = ("Price_euro", "Mileage_km")
+
+Delta = namedtuple("Delta", ["added", "removed", "changed"])
+
+
+def _keyed(snapshot: pd.DataFrame) -> pd.DataFrame:
+    snapshot = snapshot[snapshot["AdId"].notna()]
+    return snapshot.drop_duplicates("AdId", keep="last").reset_index(drop=True)
+
+
+def diff_snapshots(previous: pd.DataFrame, current: pd.DataFrame, tracked: tuple = TRACKED) -> Delta:
+    """
+    Compares two snapshots of the catalogue keyed on AdId with one vectorized outer join, so full-catalogue snapshots are
+    compared in linear time instead of row by row. Adverts without an ID cannot be matched and are ignored.
+
+    Parameters:
+        * previous(pd.DataFrame): the earlier snapshot, e.g. yesterday's into_pandas() result or read_snapshot().
+        * current(pd.DataFrame): the new snapshot.
+        * tracked(tuple): the attributes compared for adverts present in both snapshots.
+
+    Returns:
+        * Delta(added, removed, changed) tuple:
+            - added(pd.DataFrame): rows of current whose AdId is not in previous;
+            - removed(pd.DataFrame): rows of previous whose AdId is not in current;
+            - changed(pd.DataFrame): AdId, Marque and, for every tracked attribute, its previous and current values and the
+              difference (e.g. Price_euro_change below zero is a price drop), one row per advert with a changed attribute.
+    """
+    previous, current = _keyed(previous), _keyed(current)
+    merged = previous[["AdId", *tracked]].merge(
+        current[["AdId", "Marque", *tracked]],
+        on="AdId",
+        how="outer",
+        suffixes=("_previous", "_current"),
+        indicator=True,
+    )
+    side = merged["_merge"]
+    added = current[current["AdId"].isin(merged.loc[side == "right_only", "AdId"])]
+    removed = previous[previous["AdId"].isin(merged.loc[side == "left_only", "AdId"])]
+    both = merged[side == "both"]
+    changed = pd.Series(False, index=both.index)
+    columns = {"AdId": both["AdId"], "Marque": both["Marque"]}
+    for column in tracked:
+        before, after = both[f"{column}_previous"], both[f"{column}_current"]
+        # A value which appears or disappears is a change as well; NA on both sides is not.
+        changed |= after.ne(before).fillna(False).astype(bool) | (after.isna() != before.isna())
+        columns[f"{column}_previous"] = before
+        columns[f"{column}_current"] = after
+        columns[f"{column}_change"] = after - before
+    changed = pd.DataFrame(columns)[changed.to_numpy()]
+    return Delta(added.reset_index(drop=True), removed.reset_index(drop=True), changed.reset_index(drop=True))
+
+
+def delta_frame(delta: Delta) -> pd.DataFrame:
+    """
+    Flattens a Delta into one compact change feed with a change column ("added", "removed" or "changed"). Added and removed
+    adverts keep all their attributes, changed ones only their ID, marque and the tracked values.
+    """
+    return pd.concat(
+        [
+            delta.added.assign(change="added"),
+            delta.removed.assign(change="removed"),
+            delta.changed.assign(change="changed"),
+        ],
+        ignore_index=True,
+    )[["change", *dict.fromkeys([*delta.added.columns, *delta.changed.columns])]]
+
+
+def read_snapshot(path: str) -> pd.DataFrame:
+    """
+    Reads a snapshot written by write_snapshot(); .parquet and .feather files need pyarrow, any other file is read as .csv
+    and converted back to the dtypes of into_pandas().
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".feather"):
+        return pd.read_feather(path)
+    snapshot = pd.read_csv(path)
+    return snapshot.astype({column: dtype for column, (_, dtype) in SOURCES.items() if column in snapshot.columns})
+
+
+def write_snapshot(snapshot: pd.DataFrame, path: str):
+    """
+    Writes a snapshot as .parquet, .feather or, for any other file, .csv. The file is replaced atomically, so a run which
+    crashes while writing leaves the previous snapshot intact.
+    """
+    buffer = io.BytesIO()
+    if path.endswith(".parquet"):
+        snapshot.to_parquet(buffer, index=False)
+    elif path.endswith(".feather"):
+        snapshot.reset_index(drop=True).to_feather(buffer)
+    else:
+        buffer.write(snapshot.to_csv(index=False).encode())
+    write_atomic(path, buffer.getvalue())
+
+
+def _carry_over(previous: pd.DataFrame, current: pd.DataFrame) -> pd.DataFrame:
+    # The adverts of the previous snapshot which a partial run did not see are kept; those it did see take its values.
+    kept = previous[previous["AdId"].notna() & ~previous["AdId"].isin(current["AdId"].dropna())]
+    merged = pd.concat([kept, current], ignore_index=True)
+    return merged.astype({column: dtype for column, (_, dtype) in SOURCES.items() if column in merged.columns})
+
+
+def diff_with_snapshot(
+    current: pd.DataFrame,
+    snapshot: str = "autoplius_snapshot.csv",
+    delta: str = "autoplius_delta.csv",
+    track_removed: bool = True,
+) -> Delta:
+    """
+    Compares the current run with the snapshot stored by the previous run, writes the change feed to the delta file and stores
+    the current run as the new snapshot. Without a stored snapshot every advert is reported as added.
+
+    Parameters:
+        * current(pd.DataFrame): the result of the current run.
+        * snapshot(str): the stored snapshot (.csv, .parquet or .feather).
+        * delta(str): the change feed file written by this run (see delta_frame()), .csv unless it ends with .parquet.
+        * track_removed(bool): report adverts missing from the current run as removed; turn it off when the run does not
+          cover the whole catalogue. The new snapshot then also keeps the adverts of the stored one which the run missed,
+          so the next full run does not report them as added.
+
+    Returns:
+        * Delta(added, removed, changed) tuple, see diff_snapshots().
+    """
+    previous = read_snapshot(snapshot) if os.path.exists(snapshot) else current.iloc[:0]
+    result = diff_snapshots(previous, current)
+    if not track_removed:
+        result = result._replace(removed=result.removed.iloc[:0])
+    feed = delta_frame(result)
+    if delta.endswith(".parquet"):
+        feed.to_parquet(delta, index=False)
+    else:
+        feed.to_csv(delta, index=False)
+    write_snapshot(current if track_removed else _carry_over(previous, current), snapshot)
+    return result
@@ -0,0 +1,364 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from function.lazy import LazyModule
+from function.autoplius_scraper import autoplius_scraper
+from function.buffers import ColumnBuffers
+from function.diff import read_snapshot, write_snapshot
+from function.listing import ListingQuery
+from function.normalize import CATEGORY_COLUMNS
+from function.seen import SeenIndex
+
+pd = LazyModule("pandas")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS shards_state ON shards (state, lease_until);
+"""
+
+
+class Shard:
+    """
+    One unit of work of a distributed crawl: the pages of a (possibly filtered) listing from first_page up to the page
+    holding advert number sample_size.
+    """
+
+    def __init__(self, id: int, payload: dict, attempts: int = 0):
+        self.id = id
+        self.payload = payload
+        self.attempts = attempts
+
+    @property
+    def query(self) -> ListingQuery:
+        return ListingQuery(self.payload["base_url"], **self.payload["filters"])
+
+    @property
+    def first_page(self) -> int:
+        return self.payload["first_page"]
+
+    @property
+    def sample_size(self) -> int:
+        return self.payload["sample_size"]
+
+    def __repr__(self) -> str:
+        return f"Shard({self.id}, {self.query!r}, first_page={self.first_page}, sample_size={self.sample_size})"
+
+
+class WorkQueue:
+    """
+    Shared queue of crawl shards in a SQLite database, e.g. on a shared volume, which workers on several processes or nodes
+    claim, complete or fail. A claim is a lease: a shard whose worker died is handed out again once its lease expires, and a
+    failed shard is retried until it has been attempted max_attempts times.
+
+    Parameters:
+        * path(str): the database file, created when missing.
+        * max_attempts(int): the number of claims after which a failing shard is given up.
+        * journal_mode(str): "DELETE" (the rollback journal) works wherever file locks do, including NFS and SMB volumes
+          shared between hosts. "WAL" lets readers run alongside a writer, but needs shared memory, so every worker must
+          then run on the host holding the database.
+    """
+
+    def __init__(self, path: str = "autoplius_queue.db", max_attempts: int = 3, journal_mode: str = "DELETE"):
+        self.path = path
+        self.max_attempts = max_attempts
+        with self.__connect() as db:
+            # The mode is stored in the database file, so it is set every time, e.g. to leave WAL for a shared volume.
+            db.execute(f"PRAGMA journal_mode={journal_mode}")
+            db.executescript(SCHEMA)
+
+    def __connect(self) -> "_Connection":
+        # A connection per call keeps the queue usable from several threads; transactions are explicit.
+        return _Connection(self.path)
+
+    def add(self, query: ListingQuery, sample_size: int, first_page: int = 1) -> int:
+        """
+        Adds a shard which crawls the query from first_page up to the page holding advert number sample_size.
+
+        Returns:
+            * id(int): the shard ID.
+        """
+        payload = {
+            "base_url": query.base_url,
+            "filters": query.filters,
+            "first_page": first_page,
+            "sample_size": sample_size,
+        }
+        with self.__connect() as db:
+            return db.execute("INSERT INTO shards (payload) VALUES (?)", (json.dumps(payload),)).lastrowid
+
+    def add_page_ranges(self, query: ListingQuery, sample_size: int, pages_per_shard: int = 10) -> list:
+        """
+        Splits the crawl of sample_size adverts of one listing into shards of pages_per_shard consecutive pages.
+
+        Returns:
+            * ids(list): the shard IDs.
+        """
+        pages = len(range(0, sample_size, 20))
+        return [
+            self.add(query, min(first + pages_per_shard - 1, pages) * 20, first)
+            for first in range(1, pages + 1, pages_per_shard)
+        ]
+
+    def add_partitions(self, queries: list, sample_size: int) -> list:
+        """
+        Adds one shard per listing slice, e.g. ListingQuery().split_price(), each limited to sample_size adverts.
+
+        Returns:
+            * ids(list): the shard IDs.
+        """
+        return [self.add(query, sample_size) for query in queries]
+
+    def claim(self, worker: str, lease: float = 600) -> Shard:
+        """
+        Hands the next pending shard, or a shard whose lease has expired, to the worker.
+
+        Parameters:
+            * worker(str): the ID of the claiming worker.
+            * lease(float): seconds after which the shard is handed out again unless completed, failed or renewed.
+
+        Returns:
+            * shard(Shard): the claimed shard, None when there is nothing to claim.
+        """
+        now = time.time()
+        with self.__connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE shards SET state = 'failed', error = 'lease expired'"
+                " WHERE state = 'claimed' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            row = db.execute(
+                "SELECT id, payload, attempts FROM shards"
+                " WHERE (state = 'pending' OR (state = 'claimed' AND lease_until < ?)) AND attempts < ?"
+                " ORDER BY id LIMIT 1",
+                (now, self.max_attempts),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE shards SET state = 'claimed', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker, now + lease, row[0]),
+            )
+        return Shard(row[0], json.loads(row[1]), row[2] + 1)
+
+    def renew(self, shard: Shard, worker: str, lease: float = 600) -> bool:
+        """
+        Extends the lease of a shard which is still being crawled; False means the shard was handed to another worker.
+        """
+        with self.__connect() as db:
+            updated = db.execute(
+                "UPDATE shards SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'claimed'",
+                (time.time() + lease, shard.id, worker),
+            ).rowcount
+        return updated == 1
+
+    def complete(self, shard: Shard, worker: str, result: str) -> bool:
+        """
+        Marks the shard as done with the path of its result file; False when the shard was handed to another worker meanwhile.
+        """
+        with self.__connect() as db:
+            updated = db.execute(
+                "UPDATE shards SET state = 'done', result = ?, error = NULL WHERE id = ? AND worker = ? AND state = 'claimed'",
+                (result, shard.id, worker),
+            ).rowcount
+        return updated == 1
+
+    def fail(self, shard: Shard, worker: str, error: str):
+        """
+        Returns the shard to the queue for another attempt, or marks it as failed after max_attempts attempts.
+        """
+        with self.__connect() as db:
+            db.execute(
+                "UPDATE shards SET state = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, error = ?"
+                " WHERE id = ? AND worker = ? AND state = 'claimed'",
+                (self.max_attempts, error, shard.id, worker),
+            )
+
+    def counts(self) -> dict:
+        """
+        Returns the number of shards in every state (pending, claimed, done, failed).
+        """
+        with self.__connect() as db:
+            rows = db.execute("SELECT state, COUNT(*) FROM shards GROUP BY state").fetchall()
+        return {"pending": 0, "claimed": 0, "done": 0, "failed": 0, **dict(rows)}
+
+    def finished(self) -> bool:
+        counts = self.counts()
+        return counts["pending"] == 0 and counts["claimed"] == 0
+
+    def shards(self) -> pd.DataFrame:
+        """
+        Reports every shard with its state, worker, attempts, error and result file.
+        """
+        with self.__connect() as db:
+            rows = db.execute(
+                "SELECT id, payload, state, worker, attempts, error, result FROM shards ORDER BY id"
+            ).fetchall()
+        return pd.DataFrame(rows, columns=["id", "payload", "state", "worker", "attempts", "error", "result"])
+
+    def results(self) -> list:
+        """
+        Returns the result files of the completed shards in shard order.
+        """
+        with self.__connect() as db:
+            rows = db.execute("SELECT result FROM shards WHERE state = 'done' ORDER BY id").fetchall()
+        return [row[0] for row in rows]
+
+
+class _Connection:
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+
+    def __enter__(self) -> sqlite3.Connection:
+        return self.db
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        finally:
+            self.db.close()
+
+
+def run_worker(
+    queue: WorkQueue,
+    results: str = "autoplius_shards",
+    worker: str = None,
+    scraper_factory=None,
+    lease: float = 600,
+    **options,
+) -> int:
+    """
+    Claims shards from the queue until none are left, crawls each of them with iter_pages() and stores its records as a
+    .parquet file in the results directory (see function.diff.write_snapshot). Parquet carries data only, so the coordinator
+    never runs code written to the shared volume, and the nodes need not share a pandas version. A shard whose crawl raises
+    or skips pages is returned to the queue for another attempt.
+
+    Parameters:
+        * queue(WorkQueue): the shared queue.
+        * results(str): the directory of result files, shared with the coordinator.
+        * worker(str): the worker ID, hostname and process ID by default.
+        * scraper_factory: callable returning the autoplius_scraper used for a shard; by default a new scraper per shard.
+        * lease(float): seconds of the lease on a claimed shard.
+        * options: further iter_pages() parameters such as concurrency, rate or processes.
+
+    Returns:
+        * completed(int): the number of shards completed by this worker.
+    """
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    scraper_factory = scraper_factory or autoplius_scraper
+    os.makedirs(results, exist_ok=True)
+    completed = 0
+    while True:
+        shard = queue.claim(worker, lease)
+        if shard is None:
+            return completed
+        print(f"Worker {worker} claimed {shard}")
+        try:
+            scraper = scraper_factory()
+            batches = []
+            for batch in scraper.iter_pages(
+                shard.sample_size, query=shard.query, first_page=shard.first_page, **options
+            ):
+                batches.append(batch)
+                if not queue.renew(shard, worker, lease):
+                    raise RuntimeError("the lease expired and the shard was handed to another worker")
+            failed = scraper.failed_pages()
+            if len(failed):
+                raise RuntimeError(f"{len(failed)} pages failed: {', '.join(failed['url'])}")
+        except Exception as error:
+            queue.fail(shard, worker, f"{type(error).__name__}: {error}")
+            print(f"Worker {worker} failed {shard}: {error}")
+            continue
+        frame = pd.concat(batches, ignore_index=True) if batches else ColumnBuffers().to_pandas()
+        path = os.path.join(results, f"shard-{shard.id}-{worker}.parquet")
+        write_snapshot(frame, path)
+        if queue.complete(shard, worker, path):
+            completed += 1
+
+
+def merge_results(queue: WorkQueue, seen: SeenIndex = None) -> pd.DataFrame:
+    """
+    Merges the records of all completed shards in shard order into one dataset without duplicate adverts.
+
+    Parameters:
+        * queue(WorkQueue): the shared queue.
+        * seen(SeenIndex): the index used to drop duplicates; with a persistent index, adverts collected by earlier crawls are dropped too.
+
+    Returns:
+        * records(pd.DataFrame): the merged records with the columns and dtypes of into_pandas().
+    """
+    seen = seen if seen is not None else SeenIndex()
+    frames = []
+    for path in queue.results():
+        frame = read_snapshot(path)
+        if len(frame):
+            frames.append(frame[seen.admit(frame["AdId"])])
+    seen.flush()
+    if not frames:
+        return ColumnBuffers().to_pandas()
+    merged = pd.concat(frames, ignore_index=True)
+    # Shards have their own categories, which concat turns into plain strings.
+    for column in CATEGORY_COLUMNS:
+        merged[column] = merged[column].astype("category")
+    return merged
+
+
+def main(argv: list = None):
+    arguments = argparse.ArgumentParser(description="Distributed crawl of en.autoplius.lt through a shared SQLite work queue.")
+    arguments.add_argument("--queue", default="autoplius_queue.db", help="the shared queue database")
+    arguments.add_argument("--results", default="autoplius_shards", help="the shared directory of shard results")
+    arguments.add_argument(
+        "--journal-mode",
+        choices=("DELETE", "WAL"),
+        default="DELETE",
+        help="WAL is faster but limits the queue to the workers of one host",
+    )
+    commands = arguments.add_subparsers(dest="command", required=True)
+    plan = commands.add_parser("plan", help="add shards to the queue")
+    plan.add_argument("sample_size", type=int)
+    plan.add_argument("--base-url", default="https://en.autoplius.lt")
+    plan.add_argument("--pages-per-shard", type=int, default=10)
+    plan.add_argument("--split-price", action="store_true", help="one shard per price band instead of page ranges")
+    work = commands.add_parser("work", help="claim and crawl shards until the queue is empty")
+    work.add_argument("--concurrency", type=int, default=1)
+    work.add_argument("--rate", type=float)
+    commands.add_parser("status", help="print the number of shards per state")
+    merge = commands.add_parser("merge", help="merge the completed shards into a .csv file")
+    merge.add_argument("output", nargs="?", default="autoplius.csv")
+    options = arguments.parse_args(argv)
+    queue = WorkQueue(options.queue, journal_mode=options.journal_mode)
+    if options.command == "plan":
+        query = ListingQuery(options.base_url)
+        if options.split_price:
+            ids = queue.add_partitions(query.split_price(), options.sample_size)
+        else:
+            ids = queue.add_page_ranges(query, options.sample_size, options.pages_per_shard)
+        print(f"{len(ids)} shards added to {options.queue}")
+    elif options.command == "work":
+        completed = run_worker(queue, options.results, concurrency=options.concurrency, rate=options.rate)
+        print(f"{completed} shards completed")
+    elif options.command == "status":
+        print(queue.counts())
+    else:
+        merged = merge_results(queue)
+        merged.to_csv(options.output, index=False)
+        print(f"{len(merged)} adverts merged into {options.output}")
+
+
+if __name__ == "__main__":
+    main()
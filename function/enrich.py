@@ -0,0 +1,167 @@
+from __future__ import annotations
+import re
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import urlsplit
+from function.lazy import LazyModule
+from function.cache import CacheMiss
+from function.fetch import AdaptiveRateLimiter, PageResult, RateLimiter, Transport, fetch_pages
+
+bs4 = LazyModule("bs4")
+pd = LazyModule("pandas")
+
+# Detail page parameter label: output column.
+DETAIL_FIELDS = {
+    "Colour": "Colour",
+    "Color": "Colour",
+    "Defects": "Defects",
+    "Location": "Location",
+    "Number of doors": "Doors",
+    "Drive wheels": "DriveWheels",
+    "First registration country": "FirstRegistrationCountry",
+    "VIN code": "VIN",
+}
+
+DETAIL_COLUMNS = tuple(dict.fromkeys(DETAIL_FIELDS.values()))
+
+
+@lru_cache(maxsize=None)
+def _parameters():
+    # Only the parameter table is built into a tree, the rest of the detail page is skipped while parsing.
+    return bs4.SoupStrainer("div", class_=re.compile(r"(^|\s)parameter-row(\s|$)"))
+
+
+def parse_detail(content: bytes, parser: str = "html.parser") -> dict:
+    """
+    Reads the parameter table of an advert detail page (parameter-row elements with a parameter-label and a parameter-value).
+
+    Parameters:
+        * content(bytes): html code of the detail page.
+        * parser(str): BeautifulSoup tree builder ("html.parser" or "lxml").
+
+    Returns:
+        * details(dict): the values of the labels in DETAIL_FIELDS, keyed by their output column.
+    """
+    soup = bs4.BeautifulSoup(content, parser, parse_only=_parameters())
+    details = {}
+    for row in soup.find_all("div", class_="parameter-row"):
+        label = row.find("div", class_="parameter-label")
+        value = row.find("div", class_="parameter-value")
+        if label is None or value is None:
+            continue
+        column = DETAIL_FIELDS.get(label.get_text(strip=True).rstrip(":"))
+        if column is not None:
+            details[column] = value.get_text(" ", strip=True)
+    return details
+
+
+class _DetailCache:
+    # A detail page missing from an offline cache fails on its own, like a page which could not be downloaded, instead of
+    # stopping the enrichment of all the others.
+    def __init__(self, cache):
+        self.cache = cache
+
+    def fetch(self, transport: Transport, url: str) -> PageResult:
+        try:
+            return self.cache.fetch(transport, url)
+        except CacheMiss as error:
+            return PageResult(url, error=f"{type(error).__name__}: {error}")
+
+
+class DetailEnricher:
+    """
+    Follows the links of scraped adverts to their detail pages and collects the richer attributes found there (colour,
+    defects, location, VIN and more). Pages are fetched concurrently, at most concurrency at a time, and every host has
+    its own adaptive request budget of at most per_host_rate requests per second, which backs off on 429, 5xx and growing
+    latency like the throttle of the listing crawl. Adverts which have already been enriched are skipped, and with a
+    response cache detail pages are served from it when possible.
+
+    Parameters:
+        * transport(Transport): the HTTP layer; every host gets a copy of it with its own AdaptiveRateLimiter whose
+          ceiling is per_host_rate.
+        * cache(ResponseCache): an optional response cache for detail pages.
+        * concurrency(int): the maximum number of detail pages downloaded at the same time.
+        * per_host_rate(float): the highest number of requests started per second on each host (None disables the limit).
+        * parser(str): BeautifulSoup tree builder used for detail pages.
+    """
+
+    def __init__(
+        self,
+        transport: Transport = None,
+        cache=None,
+        concurrency: int = 8,
+        per_host_rate: float = 2.0,
+        parser: str = "html.parser",
+    ):
+        self.transport = transport if transport is not None else Transport()
+        self.cache = cache
+        self.concurrency = concurrency
+        self.per_host_rate = per_host_rate
+        self.parser = parser
+        self.failed = {}
+        self.__details = {}
+        self.__hosts = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__details)
+
+    def __contains__(self, ad_id: int) -> bool:
+        return ad_id in self.__details
+
+    def __host_transport(self, host: str) -> Transport:
+        with self.__lock:
+            if host not in self.__hosts:
+                if self.per_host_rate:
+                    rate = self.per_host_rate
+                    limiter = AdaptiveRateLimiter(rate=rate, floor=min(0.1, rate), ceiling=rate, step=rate / 50)
+                else:
+                    limiter = RateLimiter()
+                self.__hosts[host] = self.transport.with_limiter(limiter)
+            return self.__hosts[host]
+
+    def host_rates(self) -> dict:
+        """
+        Returns the current request budget of every host enriched so far, in requests per second.
+        """
+        with self.__lock:
+            return {host: transport.limiter.rate for host, transport in self.__hosts.items()}
+
+    def enrich(self, links: dict) -> int:
+        """
+        Downloads and parses the detail pages of the adverts which have not been enriched yet.
+
+        Parameters:
+            * links(dict): ad ID: detail page URL, e.g. the links collected by a crawl.
+
+        Returns:
+            * enriched(int): the number of adverts enriched by this call. Pages which could not be downloaded are kept
+              in the failed attribute (ad ID: error) and retried by the next call.
+        """
+        hosts = defaultdict(dict)
+        for ad_id, url in links.items():
+            if ad_id not in self.__details and url:
+                hosts[urlsplit(url).netloc][url] = ad_id
+        enriched = 0
+        for host, urls in hosts.items():
+            cache = _DetailCache(self.cache) if self.cache is not None else None
+            pages = fetch_pages(list(urls), self.__host_transport(host), self.concurrency, cache)
+            for url, page in pages:
+                ad_id = urls[url]
+                if not page.ok:
+                    self.failed[ad_id] = page.error or f"HTTP {page.status_code}"
+                    continue
+                self.__details[ad_id] = parse_detail(page.content, self.parser)
+                self.failed.pop(ad_id, None)
+                enriched += 1
+        return enriched
+
+    def frame(self) -> pd.DataFrame:
+        """
+        Returns the collected detail attributes with an AdId column and one string column per DETAIL_COLUMNS entry.
+        """
+        frame = pd.DataFrame.from_dict(self.__details, orient="index", columns=list(DETAIL_COLUMNS))
+        frame = frame.astype("string")
+        frame.insert(0, "AdId", pd.array(frame.index, dtype="Int64"))
+        return frame.reset_index(drop=True)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import uuid
+from datetime import date
+from function.lazy import LazyModule
+from function.normalize import CATEGORY_COLUMNS
+
+pd = LazyModule("pandas")
+
+PARTITION_BY = ("ScrapeDate", "Marque")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError as error:
+        raise ImportError(
+            "Parquet and Feather export requires pyarrow: pip install pyarrow"
+        ) from error
+    return pyarrow
+
+
+def write_dataset(
+    frame: pd.DataFrame,
+    path: str,
+    format: str = "parquet",
+    partition_by: tuple = PARTITION_BY,
+    compression: str = "zstd",
+    scrape_date: str = None,
+) -> list:
+    """
+    Writes the frame as a hive-partitioned Arrow dataset (path/ScrapeDate=2024-05-01/Marque=BMW 530/part-....parquet).
+    Every call writes new uniquely named files only, so appending a new scrape never rewrites existing partitions.
+
+    Parameters:
+        * frame(pd.DataFrame): car attributes, e.g. the result of into_pandas() or a batch of iter_pages().
+        * path(str): the dataset directory.
+        * format(str): "parquet" or "feather".
+        * partition_by(tuple): partition columns; ScrapeDate is added to the frame when missing.
+        * compression(str): codec of the written files, e.g. "zstd", "lz4" or "snappy" (parquet only).
+        * scrape_date(str): ISO date of the scrape, today by default.
+
+    Returns:
+        * files(list): paths of the written files.
+    """
+    pa = _pyarrow()
+    if "ScrapeDate" not in frame.columns:
+        frame = frame.assign(ScrapeDate=scrape_date or date.today().isoformat())
+    frame = frame.astype({column: "string" for column in partition_by})
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if format == "parquet":
+        file_format = pa.dataset.ParquetFileFormat()
+    elif format == "feather":
+        file_format = pa.dataset.IpcFileFormat()
+    else:
+        raise ValueError(f"Unknown dataset format {format!r}, expected 'parquet' or 'feather'")
+    written = []
+    pa.dataset.write_dataset(
+        table,
+        path,
+        format=file_format,
+        file_options=file_format.make_write_options(compression=compression),
+        partitioning=list(partition_by),
+        partitioning_flavor="hive",
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.{format}",
+        existing_data_behavior="overwrite_or_ignore",
+        file_visitor=lambda file: written.append(file.path),
+    )
+    return written
+
+
+def read_dataset(path: str, format: str = "parquet") -> pd.DataFrame:
+    """
+    Reads a dataset written by write_dataset() back into pandas, with the partition columns restored.
+    """
+    pa = _pyarrow()
+    return pa.dataset.dataset(path, format=format, partitioning="hive").to_table().to_pandas()
+
+
+class DatasetSink:
+    """
+    Sink for iter_pages() which appends the batches to a partitioned Parquet or Feather dataset as new files. A page holds
+    a few adverts of many marques, so batches are buffered and written together once buffer_rows adverts are collected
+    and on close(): every write adds one file per partition, and writing page by page would leave files of a few rows.
+
+    Parameters:
+        * path(str): the dataset directory.
+        * format(str): "parquet" or "feather".
+        * compression(str): codec of the written files.
+        * partition_by(tuple): partition columns.
+        * buffer_rows(int): the number of buffered adverts which triggers a write.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        format: str = "parquet",
+        compression: str = "zstd",
+        partition_by: tuple = PARTITION_BY,
+        buffer_rows: int = 100000,
+    ):
+        self.path = path
+        self.format = format
+        self.compression = compression
+        self.partition_by = partition_by
+        self.buffer_rows = buffer_rows
+        self.scrape_date = date.today().isoformat()
+        self.rows = 0
+        self.__batches = []
+        self.__buffered = 0
+
+    def write(self, batch: pd.DataFrame):
+        self.__batches.append(batch)
+        self.__buffered += len(batch)
+        self.rows += len(batch)
+        if self.__buffered >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered batches to the dataset.
+        """
+        batches = [batch for batch in self.__batches if len(batch)]
+        self.__batches, self.__buffered = [], 0
+        if not batches:
+            return
+        frame = pd.concat(batches, ignore_index=True)
+        # Pages have their own categories, which concat turns into plain strings.
+        frame = frame.astype({column: "category" for column in CATEGORY_COLUMNS if column in frame.columns})
+        write_dataset(
+            frame,
+            self.path,
+            self.format,
+            self.partition_by,
+            self.compression,
+            self.scrape_date,
+        )
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+
+TITLE = ("div", "class", "announcement-title")
+PRICING = ("div", "class", "announcement-pricing-info")
+
+# Raw fields captured from every advert: (field name, (tag, attribute, value) locator). Extraction only copies the
+# node text; parsing and cleaning the values is done per batch by function.normalize.
+FIELDS = (
+    ("title", TITLE),
+    ("date", ("span", "title", "Date of manufacture")),
+    ("fuel", ("span", "title", "Fuel type")),
+    ("gearbox", ("span", "title", "Gearbox")),
+    ("power", ("span", "title", "Power")),
+    ("mileage", ("span", "title", "Mileage")),
+    ("price", PRICING),
+)
+
+# Attributes of the announcement-item anchor itself: (field name, attribute).
+ATTRIBUTES = (("href", "href"),)
+
+COLUMNS = tuple(name for name, _ in FIELDS) + tuple(name for name, _ in ATTRIBUTES)
+
+
+class RecordExtractor:
+    """
+    Extracts raw car records from announcement-item soups in a single pass. The field spec is compiled once
+    into a per-tag lookup table, so every advert subtree is walked only once regardless of the number of fields.
+    """
+
+    def __init__(self, fields: tuple = FIELDS, attributes: tuple = ATTRIBUTES):
+        self.columns = tuple(name for name, _ in fields) + tuple(name for name, _ in attributes)
+        self.__attributes = tuple(attribute for _, attribute in attributes)
+        locators = []
+        targets = {}
+        for position, (name, locator) in enumerate(fields):
+            if locator not in targets:
+                locators.append(locator)
+                targets[locator] = []
+            targets[locator].append(position)
+        self.__locators = tuple(locators)
+        self.__targets = targets
+        self.__by_tag = {}
+        for locator in locators:
+            self.__by_tag.setdefault(locator[0], []).append(locator)
+
+    def texts(self, car: BeautifulSoup) -> dict:
+        """
+        Walks the advert subtree once and returns the text of the first node matching each locator.
+
+        Parameters:
+            * car(BeautifulSoup): a single announcement-item soup.
+
+        Returns:
+            * texts(dict): locator to node text; locators without a matching node are absent.
+        """
+        by_tag = self.__by_tag
+        texts = {}
+        pending = len(self.__locators)
+        for node in car.descendants:
+            candidates = by_tag.get(node.name)
+            if candidates is None:
+                continue
+            for locator in candidates:
+                if locator in texts:
+                    continue
+                actual = node.get(locator[1])
+                if actual is None:
+                    continue
+                if locator[2] in actual if isinstance(actual, list) else actual == locator[2]:
+                    texts[locator] = node.text
+                    pending -= 1
+            if not pending:
+                break
+        return texts
+
+    def extract(self, car: BeautifulSoup) -> tuple:
+        """
+        Extracts one raw record from a single advert.
+
+        Parameters:
+            * car(BeautifulSoup): a single announcement-item soup.
+
+        Returns:
+            * record(tuple): node texts in column order; fields without a matching node are None.
+        """
+        record = [None] * (len(self.columns) - len(self.__attributes))
+        for locator, text in self.texts(car).items():
+            for position in self.__targets[locator]:
+                record[position] = text
+        return (*record, *(car.get(attribute) for attribute in self.__attributes))
+
+    def extract_all(self, cars: list) -> list:
+        """
+        Extracts records from every advert.
+
+        Parameters:
+            * cars(list): announcement-item soups as returned by find_announcements().
+
+        Returns:
+            * records(list): a list of raw record tuples in column order.
+        """
+        extract = self.extract
+        return [extract(car) for car in cars]
+
+
+extractor = RecordExtractor()
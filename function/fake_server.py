@@ -0,0 +1,286 @@
+import argparse
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from function.synthetic import advert_attributes, synthetic_detail, synthetic_listing
+
+LISTING_PATH = "/ads/used-cars"
+DETAIL_PATH = re.compile(r"^/ads/used-cars/.+-(\d+)\.html$")
+
+# Listing filter: (advert attribute, comparison) of synthetic pages, see function.listing.FILTERS.
+FILTERS = {
+    "make_id": ("make_id", lambda value, bound: value == bound),
+    "make_date_from": ("year", lambda value, bound: value >= bound),
+    "make_date_to": ("year", lambda value, bound: value <= bound),
+    "sell_price_from": ("price", lambda value, bound: value >= bound),
+    "sell_price_to": ("price", lambda value, bound: value <= bound),
+}
+
+
+class FakeListingServer:
+    """
+    Local stand-in for en.autoplius.lt which serves paginated ads/used-cars?page_nr=N listing pages in the markup the scraper
+    expects, so crawls can be tuned and load-tested without using the real website. Pages are generated synthetically
+    (newest adverts first) or replayed from captured pages. Latency, injected 429 and 5xx responses, slowly sent bodies
+    and listing churn are configurable. The adverts of synthetic pages link to detail pages served by the same server, and
+    synthetic listings can be filtered by make_id, make_date_from/to and sell_price_from/to like the real website.
+
+    Parameters:
+        * pages(dict): captured pages to replay, page number: html code; None generates synthetic pages.
+        * ads_per_page(int): the number of adverts on a synthetic page.
+        * total_ads(int): the number of synthetic adverts listed at start; pages beyond them are empty.
+        * latency(float): seconds to wait before answering every request.
+        * error_rate(float): share of requests answered with 503.
+        * throttle_rate(float): share of requests answered with 429 and a Retry-After of retry_after seconds.
+        * retry_after(float): the Retry-After of injected 429 responses.
+        * slow_body(float): seconds over which every body is sent in small chunks.
+        * churn(int): the number of new adverts listed after every served listing page, which pushes older adverts
+          towards later pages like new listings do during a real crawl.
+        * seed(int): seed of the injected failures and of the synthetic adverts.
+    """
+
+    def __init__(
+        self,
+        pages: dict = None,
+        ads_per_page: int = 20,
+        total_ads: int = 10000,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: float = 1.0,
+        slow_body: float = 0.0,
+        churn: int = 0,
+        seed: int = 0,
+    ):
+        self.pages = pages
+        self.ads_per_page = ads_per_page
+        self.total_ads = total_ads
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.slow_body = slow_body
+        self.churn = churn
+        self.seed = seed
+        self.first_id = 30000000
+        self.requests = 0
+        self.injected = {429: 0, 503: 0}
+        self.__arrived = 0
+        self.__attributes = {}
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeListingServer":
+        """
+        Starts serving on a free local port in a background thread.
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def listing_ids(self, page_no: int, filters: dict = None) -> list:
+        """
+        Returns the ad IDs which a synthetic listing page currently shows, newest first.
+
+        Parameters:
+            * page_no(int): the page number.
+            * filters(dict): listing filters, query parameter: integer value.
+        """
+        newest = self.first_id + self.total_ads + self.__arrived
+        oldest = self.first_id
+        if not filters:
+            top = newest - (page_no - 1) * self.ads_per_page
+            return list(range(top, max(top - self.ads_per_page, oldest), -1))
+        skip = (page_no - 1) * self.ads_per_page
+        ad_ids = []
+        for ad_id in range(newest, oldest, -1):
+            if not self.__matches(ad_id, filters):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            ad_ids.append(ad_id)
+            if len(ad_ids) == self.ads_per_page:
+                break
+        return ad_ids
+
+    def __matches(self, ad_id: int, filters: dict) -> bool:
+        attributes = self.__attributes.get(ad_id)
+        if attributes is None:
+            attributes = self.__attributes[ad_id] = advert_attributes(ad_id, self.seed)
+        for name, bound in filters.items():
+            if name not in FILTERS:
+                continue
+            attribute, matches = FILTERS[name]
+            value = attributes[attribute]
+            if value is None or not matches(value, bound):
+                return False
+        return True
+
+    def page(self, page_no: int, filters: dict = None) -> bytes:
+        """
+        Returns html code of a listing page, None when a replayed page does not exist.
+        """
+        if self.pages is not None:
+            return self.pages.get(page_no)
+        with self.__lock:
+            ad_ids = self.listing_ids(page_no, filters)
+            self.__arrived += self.churn
+        return synthetic_listing(ad_ids, page_no, self.seed, self.base_url)
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        with self.__lock:
+            self.requests += 1
+            draw = self.__random.random()
+        if self.latency:
+            time.sleep(self.latency)
+        if draw < self.throttle_rate:
+            self.__inject(request, 429, {"Retry-After": str(self.retry_after)})
+            return
+        if draw < self.throttle_rate + self.error_rate:
+            self.__inject(request, 503)
+            return
+        url = urlsplit(request.path)
+        body = None
+        detail = DETAIL_PATH.match(url.path)
+        if url.path == LISTING_PATH:
+            query = {name: values[0] for name, values in parse_qs(url.query).items()}
+            try:
+                page_no = int(query.pop("page_nr", 1))
+                body = self.page(page_no, {name: int(value) for name, value in query.items()})
+            except ValueError:
+                body = None
+        elif detail is not None:
+            body = synthetic_detail(int(detail.group(1)), self.seed)
+        if body is None:
+            self.__send(request, 404, b"")
+            return
+        self.__send(request, 200, body)
+
+    def __inject(self, request: BaseHTTPRequestHandler, status: int, headers: dict = None):
+        with self.__lock:
+            self.injected[status] += 1
+        self.__send(request, status, b"", headers)
+
+    def __send(self, request: BaseHTTPRequestHandler, status: int, body: bytes, headers: dict = None):
+        request.send_response(status)
+        request.send_header("Content-Type", "text/html; charset=utf-8")
+        request.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        if not self.slow_body or not body:
+            request.wfile.write(body)
+            return
+        chunks = [body[i : i + 1024] for i in range(0, len(body), 1024)]
+        for chunk in chunks:
+            request.wfile.write(chunk)
+            request.wfile.flush()
+            time.sleep(self.slow_body / len(chunks))
+
+
+def load_test(server: FakeListingServer, sample_size: int = 2000, scraper=None, **options) -> dict:
+    """
+    Crawls the fake server end to end with multiple_scrapes() and measures the throughput.
+
+    Parameters:
+        * server(FakeListingServer): a started server.
+        * sample_size(int): the number of adverts to crawl.
+        * scraper(autoplius_scraper): the scraper to use, e.g. with its own transport; by default a new one pointed at the server
+          whose adaptive throttle may go up to 1000 requests per second instead of the polite limits used for the real website.
+        * options: further multiple_scrapes() parameters such as concurrency, rate or processes.
+
+    Returns:
+        * results(dict): adverts collected, seconds, ads_per_second, requests served, injected failures and failed pages.
+    """
+    from function.autoplius_scraper import autoplius_scraper
+    from function.fetch import AdaptiveRateLimiter
+
+    if scraper is None:
+        throttle = AdaptiveRateLimiter(rate=10, floor=1, ceiling=1000, step=5)
+        scraper = autoplius_scraper(base_url=server.base_url, throttle=throttle)
+    requests = server.requests
+    start = time.perf_counter()
+    scraper.multiple_scrapes(sample_size, **options)
+    seconds = time.perf_counter() - start
+    ads = len(scraper.into_pandas())
+    return {
+        "ads": ads,
+        "seconds": seconds,
+        "ads_per_second": ads / seconds if seconds else None,
+        "requests": server.requests - requests,
+        "injected": dict(server.injected),
+        "failed_pages": len(scraper.failed_pages()),
+    }
+
+
+def main(argv: list = None):
+    arguments = argparse.ArgumentParser(description="Serves fake en.autoplius.lt listing pages on a local port.")
+    arguments.add_argument("--ads-per-page", type=int, default=20)
+    arguments.add_argument("--total-ads", type=int, default=10000)
+    arguments.add_argument("--latency", type=float, default=0.0)
+    arguments.add_argument("--error-rate", type=float, default=0.0)
+    arguments.add_argument("--throttle-rate", type=float, default=0.0)
+    arguments.add_argument("--slow-body", type=float, default=0.0)
+    arguments.add_argument("--churn", type=int, default=0)
+    arguments.add_argument("--load-test", type=int, metavar="SAMPLE_SIZE", help="crawl the server once and print the throughput")
+    arguments.add_argument("--concurrency", type=int, default=4)
+    arguments.add_argument("--rate", type=float, help="fixed request rate of the load test")
+    options = arguments.parse_args(argv)
+    server = FakeListingServer(
+        ads_per_page=options.ads_per_page,
+        total_ads=options.total_ads,
+        latency=options.latency,
+        error_rate=options.error_rate,
+        throttle_rate=options.throttle_rate,
+        slow_body=options.slow_body,
+        churn=options.churn,
+    ).start()
+    try:
+        if options.load_test:
+            print(load_test(server, options.load_test, concurrency=options.concurrency, rate=options.rate))
+            return
+        print(f"Serving fake listing pages at {server.base_url}{LISTING_PATH}?page_nr=1")
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
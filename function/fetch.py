@@ -0,0 +1,400 @@
+from __future__ import annotations
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from function.lazy import LazyModule
+
+requests = LazyModule("requests")
+
+try:
+    import brotli  # noqa: F401  urllib3 decodes br bodies only when a brotli package is installed
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+    except ImportError:
+        brotli = None
+    else:
+        brotli = brotlicffi
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/44.0.2403.157 Safari/537.36",
+    "Accept-Language": "en-US, en;q=0.5",
+    "Accept-Encoding": "gzip, deflate, br" if brotli is not None else "gzip, deflate",
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class FetchError(Exception):
+    """
+    Raised by scrape_page() when a page could not be downloaded; carries the failed PageResult.
+    """
+
+    def __init__(self, page):
+        super().__init__(f"{page.url}: {page.error}")
+        self.page = page
+
+
+class PageResult:
+    """
+    Outcome of downloading one page. It has the attributes of requests.Response which the scraper uses, and failed downloads
+    are explicit results with error set instead of empty pages. wire_bytes is the size of the body as transferred, before
+    gzip or brotli decoding, when it is known.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int = None,
+        content: bytes = b"",
+        headers: dict = None,
+        error: str = None,
+        attempts: int = 1,
+        elapsed: float = 0.0,
+        from_cache: bool = False,
+        wire_bytes: int = None,
+    ):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self.error = error
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.from_cache = from_cache
+        self.wire_bytes = wire_bytes
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status_code is not None and self.status_code < 400
+
+
+def new_session(pool_size: int = 10) -> requests.Session:
+    """
+    Creates a keep-alive requests session with the scraper headers and a connection pool shared by all fetching threads.
+
+    Parameters:
+        * pool_size(int): the number of connections kept open per host.
+
+    Returns:
+        * session(requests.Session): a session ready for concurrent use.
+    """
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class RateLimiter:
+    """
+    Global politeness budget shared by all fetching threads: requests are spaced so that no more than rate requests
+    per second are started. A rate of None disables the limit.
+    """
+
+    def __init__(self, rate: float = None):
+        self.rate = rate
+        self.requests = 0
+        self.__lock = threading.Lock()
+        self.__next_slot = 0.0
+        self.__first = None
+        self.__last = None
+
+    def wait(self):
+        """
+        Blocks the calling thread until it may start its next request.
+        """
+        if not self.rate:
+            return
+        with self.__lock:
+            now = time.monotonic()
+            slot = max(now, self.__next_slot)
+            self.__next_slot = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def record(self, status: int, latency: float, retry_after: float = None):
+        """
+        Counts a response for effective_rate; a fixed budget ignores the outcome of requests, see AdaptiveRateLimiter.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.requests += 1
+            self.__first = now if self.__first is None else self.__first
+            self.__last = now
+
+    @property
+    def effective_rate(self) -> float:
+        """
+        Requests per second actually completed between the first and the last recorded response.
+        """
+        with self.__lock:
+            if self.requests < 2 or self.__last == self.__first:
+                return None
+            return (self.requests - 1) / (self.__last - self.__first)
+
+
+def retry_after_seconds(value: str) -> float:
+    """
+    Converts a Retry-After header, given either in seconds or as an HTTP date, into seconds from now.
+
+    Parameters:
+        * value(str): the header value or None.
+
+    Returns:
+        * seconds(float): the requested pause, None when the header is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    Request budget which adapts to the server: while responses are successful and latency stays near the best seen so far,
+    the rate grows by step requests per second after every response; on 429, 5xx or connection errors it is multiplied by
+    backoff, and when the smoothed latency exceeds slowdown times its best value it is reduced by a fifth. Retry-After
+    pauses all threads for the requested time. The rate always stays between floor and ceiling. Responses are counted for
+    effective_rate like those of a fixed RateLimiter.
+
+    Parameters:
+        * rate(float): the initial rate in requests per second (the default matches the former average 6 s pause).
+        * floor(float): the lowest rate.
+        * ceiling(float): the highest rate.
+        * step(float): additive increase after a healthy response.
+        * backoff(float): multiplicative decrease after an error.
+        * slowdown(float): latency growth factor treated as a sign of overload.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1 / 6,
+        floor: float = 0.1,
+        ceiling: float = 1.0,
+        step: float = 0.02,
+        backoff: float = 0.5,
+        slowdown: float = 2.0,
+    ):
+        super().__init__(min(max(rate, floor), ceiling))
+        self.floor = floor
+        self.ceiling = ceiling
+        self.step = step
+        self.backoff = backoff
+        self.slowdown = slowdown
+        self.errors = 0
+        self.__lock = threading.Lock()
+        self.__next_slot = 0.0
+        self.__paused_until = 0.0
+        self.__latency = None
+        self.__best_latency = None
+
+    def wait(self):
+        """
+        Blocks the calling thread until it may start its next request.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            slot = max(now, self.__next_slot, self.__paused_until)
+            self.__next_slot = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def record(self, status: int, latency: float, retry_after: float = None):
+        """
+        Adjusts the rate after a response.
+
+        Parameters:
+            * status(int): HTTP status code, None for a connection error or timeout.
+            * latency(float): seconds the request took.
+            * retry_after(float): seconds requested by the server's Retry-After header.
+        """
+        super().record(status, latency, retry_after)
+        with self.__lock:
+            if retry_after:
+                self.__paused_until = max(self.__paused_until, time.monotonic() + retry_after)
+            if status is None or status == 429 or status >= 500:
+                self.errors += 1
+                self.rate = max(self.floor, self.rate * self.backoff)
+                return
+            self.__latency = latency if self.__latency is None else 0.7 * self.__latency + 0.3 * latency
+            if self.__best_latency is None or self.__latency < self.__best_latency:
+                self.__best_latency = self.__latency
+            if self.__latency > self.slowdown * self.__best_latency:
+                self.rate = max(self.floor, self.rate * 0.8)
+            else:
+                self.rate = min(self.ceiling, self.rate + self.step)
+
+
+class Transport:
+    """
+    Resilient HTTP layer under the scraper. Every request has connect and read timeouts, responses are read with a size limit,
+    and connection errors, timeouts and 429/5xx responses are retried with jittered exponential backoff (or after the
+    server's Retry-After). Every attempt is paced by and reported to the limiter. After the last attempt a failed PageResult
+    is returned instead of raising.
+
+    Parameters:
+        * session(requests.Session): the pooled session, new_session() by default.
+        * timeout(tuple): (connect, read) timeouts in seconds.
+        * retries(int): the number of retries after the first attempt.
+        * backoff(float): the base delay in seconds; attempt n waits a random time up to backoff * 2 ** n.
+        * max_backoff(float): the upper bound of a single delay.
+        * max_bytes(int): the largest accepted (decompressed) response body.
+        * limiter(RateLimiter or AdaptiveRateLimiter): request budget shared by all threads.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session = None,
+        timeout: tuple = (5, 30),
+        retries: int = 3,
+        backoff: float = 1.0,
+        max_backoff: float = 30.0,
+        max_bytes: int = 10 * 1024 * 1024,
+        limiter=None,
+    ):
+        self.session = session if session is not None else new_session()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_bytes = max_bytes
+        self.limiter = limiter if limiter is not None else RateLimiter()
+
+    def with_limiter(self, limiter) -> "Transport":
+        """
+        Returns a transport with the same session and settings but another request budget.
+        """
+        return Transport(
+            self.session,
+            self.timeout,
+            self.retries,
+            self.backoff,
+            self.max_backoff,
+            self.max_bytes,
+            limiter,
+        )
+
+    def __read(self, response: requests.Response) -> bytes:
+        length = response.headers.get("Content-Length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            raise ValueError(f"response of {length} bytes exceeds the {self.max_bytes} bytes limit")
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise ValueError(f"response exceeds the {self.max_bytes} bytes limit")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def get(self, url: str, headers: dict = None) -> PageResult:
+        """
+        Downloads the URL with timeouts, size limit and retries.
+
+        Parameters:
+            * url(str): website address.
+            * headers(dict): extra request headers, e.g. conditional headers of the response cache.
+
+        Returns:
+            * page(PageResult): the response, or a failed result with error set after the last attempt.
+        """
+        start = time.monotonic()
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            sent = time.monotonic()
+            retry_after = None
+            try:
+                with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    status = response.status_code
+                    retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+                    content = self.__read(response)
+                    page = PageResult(
+                        url,
+                        status,
+                        content,
+                        response.headers,
+                        None if status < 400 else f"HTTP {status}",
+                        attempt + 1,
+                        wire_bytes=_wire_bytes(response, content),
+                    )
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as error:
+                # including connections dropped in the middle of the body
+                status = None
+                page = PageResult(url, error=f"{type(error).__name__}: {error}", attempts=attempt + 1)
+            except (requests.RequestException, ValueError) as error:
+                # oversized, malformed or undecodable responses are not retried
+                self.limiter.record(None, time.monotonic() - sent)
+                return PageResult(
+                    url,
+                    error=f"{type(error).__name__}: {error}",
+                    attempts=attempt + 1,
+                    elapsed=time.monotonic() - start,
+                )
+            self.limiter.record(status, time.monotonic() - sent, retry_after)
+            retryable = status is None or status in RETRY_STATUSES
+            if not retryable or attempt == self.retries:
+                page.elapsed = time.monotonic() - start
+                return page
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            time.sleep(max(delay, retry_after or 0))
+
+
+def _wire_bytes(response: requests.Response, content: bytes) -> int:
+    # The raw urllib3 stream counts the bytes read from the socket, before the body is decompressed.
+    tell = getattr(response.raw, "tell", None)
+    try:
+        return tell() if tell is not None else len(content)
+    except (OSError, ValueError):
+        return len(content)
+
+
+def fetch_pages(urls: list, transport: Transport, concurrency: int = 4, cache=None, stats=None):
+    """
+    Fetches the given URLs on a thread pool sharing one transport and yields the results in the order of urls,
+    regardless of the order in which the downloads complete. At most 2 * concurrency results are held at a time.
+
+    Parameters:
+        * urls(list): website addresses to be fetched.
+        * transport(Transport): the transport used for every request; its limiter paces all threads.
+        * concurrency(int): the maximum number of requests in flight.
+        * cache(ResponseCache): an optional response cache; pages served from it are not paced.
+        * stats(CrawlStats): optional instrumentation; every download is timed as the fetch stage and counted.
+
+    Returns:
+        * generator of (url, PageResult) tuples in page order.
+    """
+
+    def download(url):
+        if cache is not None:
+            return cache.fetch(transport, url)
+        return transport.get(url)
+
+    def fetch(url):
+        if stats is None:
+            return download(url)
+        with stats.timer("fetch"):
+            page = download(url)
+        stats.record_fetch(page)
+        return page
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = deque()
+        for url in urls:
+            pending.append((url, pool.submit(fetch, url)))
+            if len(pending) >= 2 * concurrency:
+                url, future = pending.popleft()
+                yield url, future.result()
+        while pending:
+            url, future = pending.popleft()
+            yield url, future.result()
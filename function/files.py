@@ -0,0 +1,25 @@
+import os
+import tempfile
+
+
+def write_atomic(path: str, data: bytes):
+    """
+    Writes data to path through a temporary file in the same directory and renames it over path, so readers and
+    crashes never see a partially written file.
+
+    Parameters:
+        * path(str): the destination file.
+        * data(bytes): the file content.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
@@ -0,0 +1,32 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module which is imported on first attribute access, e.g. pd = LazyModule("pandas"). Heavy dependencies
+    (pandas, numpy, bs4, requests) are only loaded once a DataFrame is built, a page is parsed or downloaded, so the command
+    line interface and process pool workers start quickly. Modules using it need from __future__ import annotations, so that
+    annotations such as pd.DataFrame are not evaluated at import.
+
+    Parameters:
+        * name(str): the module to import, e.g. "bs4" or "requests.adapters".
+    """
+
+    def __init__(self, name: str):
+        self.__name = name
+        self.__module = None
+
+    def __load(self):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return self.__module
+
+    def __getattr__(self, attribute: str):
+        # Attributes are kept on the stand-in, so later lookups cost as much as on the module itself.
+        value = getattr(self.__load(), attribute)
+        setattr(self, attribute, value)
+        return value
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__module is not None else "not loaded"
+        return f"<lazy module {self.__name!r} ({state})>"
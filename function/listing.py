@@ -0,0 +1,114 @@
+from urllib.parse import urlencode
+
+LISTING_PATH = "/ads/used-cars"
+
+# Filters of the used-cars listing and the query parameters the website expects for them.
+FILTERS = {
+    "make": "make_id",
+    "model": "model_id",
+    "year_from": "make_date_from",
+    "year_to": "make_date_to",
+    "price_from": "sell_price_from",
+    "price_to": "sell_price_to",
+    "fuel": "fuel_id",
+    "body_type": "body_type_id",
+}
+
+# Price band edges in euro used to split a full crawl into slices of a similar number of adverts.
+PRICE_BANDS = (0, 1000, 2000, 3000, 4000, 5000, 7000, 10000, 15000, 20000, 30000, 50000)
+
+
+class ListingQuery:
+    """
+    Builder of filtered used-cars listing URLs, e.g. ListingQuery().make(43).years(2010, 2015).price(2000, 5000).
+    Queries are immutable: every builder method returns a new query. split_price() and split() cut a query into
+    disjoint slices which can be crawled independently and merged without duplicates.
+
+    Parameters:
+        * base_url(str): the website, e.g. the address of a local function.fake_server.FakeListingServer.
+        * filters: initial filters, keyed by the names of FILTERS or directly by website query parameters.
+    """
+
+    def __init__(self, base_url: str = "https://en.autoplius.lt", **filters):
+        self.base_url = base_url.rstrip("/")
+        self.filters = {
+            FILTERS.get(name, name): value for name, value in filters.items() if value is not None
+        }
+
+    def where(self, **filters) -> "ListingQuery":
+        """
+        Returns a copy of the query with further filters; a filter set to None is removed.
+        """
+        query = ListingQuery(self.base_url)
+        query.filters = dict(self.filters)
+        for name, value in filters.items():
+            name = FILTERS.get(name, name)
+            if value is None:
+                query.filters.pop(name, None)
+            else:
+                query.filters[name] = value
+        return query
+
+    def make(self, make_id: int) -> "ListingQuery":
+        return self.where(make=make_id)
+
+    def years(self, year_from: int = None, year_to: int = None) -> "ListingQuery":
+        return self.where(year_from=year_from, year_to=year_to)
+
+    def price(self, price_from: int = None, price_to: int = None) -> "ListingQuery":
+        return self.where(price_from=price_from, price_to=price_to)
+
+    def url(self, page: int = 1) -> str:
+        """
+        Returns the listing URL of the given page of the query.
+        """
+        parameters = sorted(self.filters.items()) + [("page_nr", page)]
+        return f"{self.base_url}{LISTING_PATH}?{urlencode(parameters)}"
+
+    def split(self, name: str, edges) -> list:
+        """
+        Cuts the query into disjoint slices by a numeric filter with inclusive bounds, such as price or year. Adverts
+        without the value, e.g. without a price, match no slice: the website has no filter for them, so only a crawl
+        of the unsplit query collects them.
+
+        Parameters:
+            * name(str): "price" or "years".
+            * edges: ascending band edges; slice i covers edges[i] to edges[i + 1] - 1 and the last slice is open-ended.
+              Values below edges[0] get a slice of their own. The slices are limited to the range already set on the query.
+
+        Returns:
+            * queries(list): one ListingQuery per non-empty slice.
+        """
+        low_name, high_name = {"price": ("price_from", "price_to"), "years": ("year_from", "year_to")}[name]
+        low = self.filters.get(FILTERS[low_name])
+        high = self.filters.get(FILTERS[high_name])
+        bounds = list(edges) + [None]
+        queries = []
+        if low is None and bounds[0] > 0 or low is not None and low < bounds[0]:
+            bounds.insert(0, low)
+        for start, end in zip(bounds, bounds[1:]):
+            end = None if end is None else end - 1
+            if low is not None:
+                start = max(start, low)
+            if high is not None:
+                end = high if end is None else min(end, high)
+            if None not in (start, end) and start > end:
+                continue
+            queries.append(self.where(**{low_name: start, high_name: end}))
+        return queries
+
+    def split_price(self, edges=PRICE_BANDS) -> list:
+        return self.split("price", edges)
+
+    def split_makes(self, make_ids) -> list:
+        return [self.make(make_id) for make_id in make_ids]
+
+    def __repr__(self) -> str:
+        filters = ", ".join(f"{name}={value!r}" for name, value in sorted(self.filters.items()))
+        return f"ListingQuery({filters})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ListingQuery) and (self.base_url, self.filters) == (other.base_url, other.filters)
+
+    def __hash__(self) -> int:
+        return hash((self.base_url, tuple(sorted(self.filters.items()))))
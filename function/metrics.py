@@ -0,0 +1,138 @@
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ("fetch", "parse", "find_announcements", "extract", "normalize", "build")
+
+
+class CrawlStats:
+    """
+    Structured instrumentation of a crawl. Every stage (fetch, parse, find_announcements, extract, normalize and build)
+    accumulates its number of calls, wall time and CPU time of the thread running it, and the crawl counts pages, downloaded
+    bytes, adverts, cache hits, failed pages and per-field extraction failures. Hooks are called with the figures of every
+    completed page, and the totals can be exported as a dict or in the Prometheus text format.
+
+    Parameters:
+        * hooks(list): callables receiving a dict (page, ads, failures, stats) after every completed page.
+    """
+
+    def __init__(self, hooks: list = None):
+        self.hooks = list(hooks or [])
+        self.stages = {stage: {"calls": 0, "wall": 0.0, "cpu": 0.0} for stage in STAGES}
+        self.pages = 0
+        self.fetched = 0
+        self.failed_pages = 0
+        self.ads = 0
+        self.bytes_downloaded = 0
+        self.cache_hits = 0
+        self.field_failures = {}
+        self.__lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Times the enclosed block as one call of the stage.
+        """
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def record(self, stage: str, wall: float, cpu: float):
+        with self.__lock:
+            totals = self.stages.setdefault(stage, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+            totals["calls"] += 1
+            totals["wall"] += wall
+            totals["cpu"] += cpu
+
+    def record_fetch(self, page):
+        """
+        Counts a fetched page: its body counts as downloaded, as transferred over the network, unless it was replayed
+        from the cache.
+        """
+        with self.__lock:
+            self.fetched += 1
+            if getattr(page, "from_cache", False):
+                self.cache_hits += 1
+            elif page.ok:
+                wire_bytes = getattr(page, "wire_bytes", None)
+                self.bytes_downloaded += len(page.content) if wire_bytes is None else wire_bytes
+            if not page.ok:
+                self.failed_pages += 1
+
+    def record_page(self, page: int, ads: int, failures):
+        """
+        Counts a completed page and calls the hooks.
+
+        Parameters:
+            * page(int): the page number.
+            * ads(int): the number of adverts extracted from it.
+            * failures(pd.DataFrame): the failure report of its normalization (see function.normalize).
+        """
+        counts = failures.groupby(["column", "reason"]).size() if len(failures) else {}
+        with self.__lock:
+            self.pages += 1
+            self.ads += ads
+            for key, count in dict(counts).items():
+                self.field_failures[key] = self.field_failures.get(key, 0) + int(count)
+        for hook in self.hooks:
+            hook({"page": page, "ads": ads, "failures": len(failures), "stats": self})
+
+    @property
+    def ads_per_page(self) -> float:
+        return self.ads / self.pages if self.pages else None
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cache_hits / self.fetched if self.fetched else None
+
+    def as_dict(self) -> dict:
+        """
+        Returns all figures as a plain dict, e.g. for logging as JSON.
+        """
+        with self.__lock:
+            return {
+                "stages": {stage: dict(totals) for stage, totals in self.stages.items()},
+                "pages": self.pages,
+                "fetched": self.fetched,
+                "failed_pages": self.failed_pages,
+                "ads": self.ads,
+                "ads_per_page": self.ads_per_page,
+                "bytes_downloaded": self.bytes_downloaded,
+                "cache_hits": self.cache_hits,
+                "cache_hit_rate": self.cache_hit_rate,
+                "field_failures": {
+                    f"{column}:{reason}": count for (column, reason), count in self.field_failures.items()
+                },
+            }
+
+    def to_prometheus(self, prefix: str = "autoplius") -> str:
+        """
+        Renders the totals in the Prometheus text exposition format, e.g. for a node_exporter textfile collector.
+        """
+        stats = self.as_dict()
+        lines = [
+            f"# TYPE {prefix}_stage_calls_total counter",
+            *(
+                f'{prefix}_stage_calls_total{{stage="{stage}"}} {totals["calls"]}'
+                for stage, totals in stats["stages"].items()
+            ),
+            f"# TYPE {prefix}_stage_seconds_total counter",
+            *(
+                f'{prefix}_stage_seconds_total{{stage="{stage}",clock="{clock}"}} {totals[clock]:.6f}'
+                for stage, totals in stats["stages"].items()
+                for clock in ("wall", "cpu")
+            ),
+        ]
+        for name in ("pages", "fetched", "failed_pages", "ads", "bytes_downloaded", "cache_hits"):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {stats[name]}")
+        lines.append(f"# TYPE {prefix}_field_failures_total counter")
+        for (column, reason), count in sorted(self.field_failures.items()):
+            lines.append(f'{prefix}_field_failures_total{{column="{column}",reason="{reason}"}} {count}')
+        return "\n".join(lines) + "\n"
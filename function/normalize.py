@@ -0,0 +1,142 @@
+from __future__ import annotations
+from collections import namedtuple
+from function.lazy import LazyModule
+from function.extractor import COLUMNS as RAW_COLUMNS
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+CATEGORY_COLUMNS = ("Marque", "CarType", "FuelType", "Gearbox")
+
+# Output column: (raw field it is parsed from, dtype).
+SOURCES = {
+    "Marque": ("title", "category"),
+    "CarType": ("title", "category"),
+    "FuelType": ("fuel", "category"),
+    "Gearbox": ("gearbox", "category"),
+    "ManufacturingDate": ("date", "Int64"),
+    "Engine_l": ("title", "Float64"),
+    "Power_kW": ("power", "Int64"),
+    "Mileage_km": ("mileage", "Int64"),
+    "Price_euro": ("price", "Int64"),
+    "AdId": ("href", "Int64"),
+}
+
+COLUMNS = tuple(SOURCES)
+
+ENGINE = r"^\s*(\d+(?:\.\d+)?)\s*l\.?\s*$"
+
+Normalized = namedtuple("Normalized", ["frame", "failures"])
+
+
+def _text(raw: pd.Series) -> pd.Series:
+    text = raw.astype("string").str.strip()
+    return text.mask(text == "")
+
+
+def _number(text: pd.Series, pattern: str, dtype: str) -> pd.Series:
+    digits = text.str.extract(pattern, expand=False).str.replace(r"\s", "", regex=True)
+    return pd.to_numeric(digits, errors="coerce").astype(dtype)
+
+
+def normalize(raw: pd.DataFrame) -> Normalized:
+    """
+    Parses and cleans a batch of raw extracted text into typed car attributes with vectorized pandas string operations.
+
+    Parameters:
+        * raw(pd.DataFrame): node texts with the columns of function.extractor.COLUMNS (title, date, fuel, gearbox, power,
+          mileage, price, href), e.g. pd.DataFrame.from_records(records, columns=COLUMNS).
+
+    Returns:
+        * Normalized(frame, failures) tuple:
+            - frame(pd.DataFrame): Marque, CarType, FuelType and Gearbox as categorical columns without surrounding
+              whitespace, ManufacturingDate, Power_kW, Mileage_km, Price_euro and AdId as Int64 and Engine_l as Float64;
+            - failures(pd.DataFrame): one row per value that could not be filled, with row (position in raw), column,
+              reason ("missing" when the advert has no such node, "unparsed" when its text could not be parsed) and raw text.
+    """
+    text = {field: _text(raw[field]) for field in RAW_COLUMNS}
+    title = text["title"]
+    parts = title.str.split(",")
+    several = (parts.str.len().fillna(0) > 1).to_numpy(dtype=bool)
+    last = parts.str[-1].str.strip()
+    second = parts.str[1].str.strip()
+    frame = pd.DataFrame(
+        {
+            "Marque": parts.str[0].str.strip(),
+            # "Tesla Model 3" has neither engine nor type; "Audi S6, 4.0 l., saloon / sedan" has both.
+            "CarType": last.where(several & ~last.str.match(ENGINE, na=False).to_numpy(dtype=bool)),
+            "FuelType": text["fuel"],
+            "Gearbox": text["gearbox"],
+            "ManufacturingDate": _number(text["date"], r"^(\d{4})", "Int64"),
+            "Engine_l": _number(second.where(several), ENGINE, "Float64"),
+            "Power_kW": _number(text["power"], r"^(\d+)", "Int64"),
+            "Mileage_km": _number(text["mileage"], r"^([\d\s]+?)\s*km$", "Int64"),
+            "Price_euro": _number(text["price"], r"^([\d\s]+?)\s*€", "Int64"),
+            # Advert links end with the ad ID: .../bmw-530-3-0-l-wagon-2005-diesel-17398822.html
+            "AdId": _number(text["href"], r"-(\d+)\.html", "Int64"),
+        },
+        index=raw.index,
+    )
+    for column in CATEGORY_COLUMNS:
+        frame[column] = frame[column].mask(frame[column] == "").astype("category")
+    # A title without an engine part is a valid title, not a parsing failure.
+    expected = {
+        "Engine_l": second.str.match(r"^\d", na=False).to_numpy(dtype=bool),
+        "CarType": several,
+    }
+    failures = []
+    for column, (field, _) in SOURCES.items():
+        source = text[field]
+        failed = frame[column].isna().to_numpy() & expected.get(column, True)
+        if not failed.any():
+            continue
+        failures.append(
+            pd.DataFrame(
+                {
+                    "row": failed.nonzero()[0],
+                    "column": column,
+                    "reason": source.isna().to_numpy()[failed],
+                    "raw": raw[field].to_numpy()[failed],
+                }
+            )
+        )
+    if failures:
+        failures = pd.concat(failures, ignore_index=True)
+        failures["reason"] = failures["reason"].map({True: "missing", False: "unparsed"})
+    else:
+        failures = pd.DataFrame({"row": [], "column": [], "reason": [], "raw": []})
+    return Normalized(frame.reset_index(drop=True), failures)
+
+
+def normalize_records(records: list) -> Normalized:
+    """
+    Normalizes raw record tuples as returned by function.extractor.RecordExtractor.
+
+    Parameters:
+        * records(list): raw record tuples ordered as function.extractor.COLUMNS.
+
+    Returns:
+        * Normalized(frame, failures) tuple, see normalize().
+    """
+    return normalize(pd.DataFrame.from_records(records, columns=list(RAW_COLUMNS)))
+
+
+def select_rows(normalized: Normalized, keep) -> Normalized:
+    """
+    Keeps the rows of a normalized batch selected by a boolean mask and renumbers the failure report accordingly.
+
+    Parameters:
+        * normalized(Normalized): a batch returned by normalize().
+        * keep(np.ndarray): boolean mask with one entry per row.
+
+    Returns:
+        * Normalized(frame, failures) tuple with the selected rows only.
+    """
+    keep = np.asarray(keep, dtype=np.bool_)
+    if keep.all():
+        return normalized
+    positions = np.cumsum(keep) - 1
+    failures = normalized.failures
+    failures = failures[keep[failures["row"].to_numpy(dtype=np.int64)]].copy()
+    failures["row"] = positions[failures["row"].to_numpy(dtype=np.int64)]
+    return Normalized(normalized.frame[keep].reset_index(drop=True), failures.reset_index(drop=True))
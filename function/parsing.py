@@ -0,0 +1,126 @@
+from __future__ import annotations
+import re
+from functools import lru_cache
+from time import perf_counter
+from typing import TYPE_CHECKING
+from function.lazy import LazyModule
+from function.extractor import extractor
+
+bs4 = LazyModule("bs4")
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# BeautifulSoup tree builders in order of preference; lxml is optional and much faster than the pure-Python html.parser.
+PARSERS = ("lxml", "html.parser", "html5lib")
+
+
+@lru_cache(maxsize=None)
+def _announcements():
+    # The class is matched with a pattern because, unlike find_all(), the strainer may see the raw multi-valued class string
+    # ("announcement-item is-highlighted") while the page is being parsed. It is built on first use so that importing the
+    # module does not import bs4.
+    return bs4.SoupStrainer("a", class_=re.compile(r"(^|\s)announcement-item(\s|$)"))
+
+
+def available_parsers() -> list:
+    """
+    Returns the parser backends which are installed in the current environment.
+
+    Parameters:
+        * None
+
+    Returns:
+        * parsers(list): names of available BeautifulSoup tree builders, fastest first.
+    """
+    return [parser for parser in PARSERS if bs4.builder.builder_registry.lookup(parser) is not None]
+
+
+def parse_listing(content: bytes, parser: str = "html.parser", only_announcements: bool = False) -> BeautifulSoup:
+    """
+    Parses html code of a listing page with the chosen backend.
+
+    Parameters:
+        * content(bytes): html code of en.autoplius.lt listing page.
+        * parser(str): BeautifulSoup tree builder, one of PARSERS.
+        * only_announcements(bool): build the tree of announcement-item adverts only and skip the rest of the page.
+          html5lib does not support partial parsing, so the flag is ignored for it.
+
+    Returns:
+        * soup(BeautifulSoup): BeautifulSoup object, which contains html code.
+    """
+    if only_announcements and parser != "html5lib":
+        return bs4.BeautifulSoup(content, parser, parse_only=_announcements())
+    return bs4.BeautifulSoup(content, parser)
+
+
+def compare_parsers(content: bytes, repeat: int = 5) -> list:
+    """
+    Times every available backend, with and without announcement-only parsing, on the given page and checks that
+    each of them yields the same records as the full html.parser tree.
+
+    Parameters:
+        * content(bytes): html code of en.autoplius.lt listing page.
+        * repeat(int): the number of parses per variant; the best time is reported.
+
+    Returns:
+        * results(list): dicts with parser, only_announcements, seconds and identical keys, fastest first.
+    """
+    reference = extractor.extract_all(
+        parse_listing(content).find_all("a", class_="announcement-item")
+    )
+    results = []
+    for parser in available_parsers():
+        for only_announcements in (False, True):
+            if only_announcements and parser == "html5lib":
+                continue
+            best = None
+            for _ in range(repeat):
+                start = perf_counter()
+                soup = parse_listing(content, parser, only_announcements)
+                elapsed = perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            records = extractor.extract_all(soup.find_all("a", class_="announcement-item"))
+            results.append(
+                {
+                    "parser": parser,
+                    "only_announcements": only_announcements,
+                    "seconds": best,
+                    "identical": records == reference,
+                }
+            )
+    return sorted(results, key=lambda result: result["seconds"])
+
+
+def fastest_parser(content: bytes, repeat: int = 5) -> tuple:
+    """
+    Chooses the fastest backend which gives records identical to html.parser on the given page.
+
+    Parameters:
+        * content(bytes): html code of a representative en.autoplius.lt listing page.
+        * repeat(int): the number of parses per variant.
+
+    Returns:
+        * (parser, only_announcements) tuple to be passed to autoplius_scraper.
+    """
+    for result in compare_parsers(content, repeat):
+        if result["identical"]:
+            return result["parser"], result["only_announcements"]
+    return "html.parser", False
+
+
+def extract_page(content: bytes, parser: str = "html.parser", only_announcements: bool = False) -> list:
+    """
+    Parses a listing page and extracts its records in one call. Only plain record tuples are returned, so the function
+    can run in a worker process and send back a compact batch instead of a soup object.
+
+    Parameters:
+        * content(bytes): html code of en.autoplius.lt listing page.
+        * parser(str): BeautifulSoup tree builder, one of PARSERS.
+        * only_announcements(bool): parse only the announcement-item adverts.
+
+    Returns:
+        * records(list): a list of record tuples ordered as extractor.COLUMNS.
+    """
+    soup = parse_listing(content, parser, only_announcements)
+    return extractor.extract_all(soup.find_all("a", class_="announcement-item"))
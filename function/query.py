@@ -0,0 +1,270 @@
+from __future__ import annotations
+import math
+from collections import defaultdict
+from itertools import combinations
+from function.lazy import LazyModule
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+# Lookup name: indexed column of into_pandas().
+DIMENSIONS = {"marque": "Marque", "year": "ManufacturingDate", "fuel": "FuelType", "gearbox": "Gearbox"}
+
+# Columns whose count, mean, median, min and max are kept for every combination of dimension values.
+MEASURES = ("Price_euro", "Mileage_km")
+
+# Bucket of the values which are zero or negative, e.g. the mileage of new cars; far below any logarithmic bucket.
+ZERO_BUCKET = -(2**31)
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with a relative error bound: positive values are counted in logarithmic buckets whose width
+    grows with the value, so any quantile is returned within relative_accuracy of a true value while the sketch holds only a
+    few hundred buckets for prices from 1 to 10^7 euro, however many adverts it has seen.
+
+    Parameters:
+        * relative_accuracy(float): the maximum relative error of quantile(), e.g. 0.01 for 1%.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.count = 0
+        self.buckets = defaultdict(int)
+
+    def bucket(self, values) -> np.ndarray:
+        """
+        Returns the bucket of every value of a numeric array.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        positive = values > 0
+        buckets = np.full(len(values), ZERO_BUCKET, dtype=np.int64)
+        buckets[positive] = np.ceil(np.log(values[positive]) / math.log(self.gamma))
+        return buckets
+
+    def add(self, values):
+        buckets, counts = np.unique(self.bucket(values), return_counts=True)
+        self.add_counts(buckets.tolist(), counts.tolist())
+
+    def add_counts(self, buckets, counts):
+        for bucket, count in zip(buckets, counts):
+            self.buckets[bucket] += count
+            self.count += count
+
+    def merge(self, other: "QuantileSketch"):
+        self.add_counts(other.buckets.keys(), other.buckets.values())
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns the q quantile (0 <= q <= 1) of the added values, None when the sketch is empty. Like
+        Series.quantile(q, interpolation="lower"), it is the value of rank q * (count - 1) rounded down, within relative_accuracy.
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                break
+        if bucket == ZERO_BUCKET:
+            return 0.0
+        return 2 * self.gamma**bucket / (self.gamma + 1)
+
+
+class Aggregate:
+    """
+    Running count, sum, min, max and quantile sketch of one measure for one combination of dimension values.
+    """
+
+    __slots__ = ("count", "total", "minimum", "maximum", "sketch")
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, count: int, total: float, minimum: float, maximum: float):
+        self.count += count
+        self.total += total
+        self.minimum = minimum if self.minimum is None else min(self.minimum, minimum)
+        self.maximum = maximum if self.maximum is None else max(self.maximum, maximum)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else None
+
+    @property
+    def median(self) -> float:
+        return self.sketch.quantile(0.5)
+
+    def as_dict(self) -> dict:
+        return {"count": self.count, "mean": self.mean, "median": self.median, "min": self.minimum, "max": self.maximum}
+
+
+class MarketIndex:
+    """
+    In-memory query layer over scraped adverts. Adverts are indexed by marque, manufacturing year, fuel type and gearbox, and
+    the count, mean, median (from a QuantileSketch), min and max of every measure are kept for every combination of these
+    dimensions, e.g. BMW 530 cars of 2010, or all diesel cars. Batches are folded into the aggregates as they arrive, so the
+    index can be used as a sink of iter_pages() (see function.sinks.drain) and a lookup never rescans the adverts.
+    Adverts already in the index are skipped, which keeps the aggregates right when pages overlap.
+
+    Parameters:
+        * measures(tuple): the numeric columns to aggregate.
+        * relative_accuracy(float): the relative error of medians and other quantiles.
+    """
+
+    def __init__(self, measures: tuple = MEASURES, relative_accuracy: float = 0.01):
+        self.measures = tuple(measures)
+        self.relative_accuracy = relative_accuracy
+        self.rows = 0
+        self.__ads = set()
+        self.__index = {name: defaultdict(set) for name in DIMENSIONS}
+        # Every subset of the dimensions, as positions in DIMENSIONS, from the whole market () to all four.
+        self.__rollups = [subset for size in range(len(DIMENSIONS) + 1) for subset in combinations(range(len(DIMENSIONS)), size)]
+        self.__aggregates = {(measure, subset): {} for measure in self.measures for subset in self.__rollups}
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, **options) -> "MarketIndex":
+        """
+        Builds the index of a whole DataFrame with the columns of into_pandas(), e.g. market = MarketIndex.from_frame(scraper.into_pandas()).
+        """
+        index = cls(**options)
+        index.write(frame)
+        return index
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def write(self, batch: pd.DataFrame):
+        """
+        Indexes a batch of adverts and folds their measures into the aggregates.
+        """
+        ad_ids = batch["AdId"]
+        new = ~ad_ids.isin(self.__ads) & ~ad_ids.duplicated() | ad_ids.isna()
+        batch = batch[new.to_numpy(dtype=bool)]
+        if batch.empty:
+            return
+        identified = batch["AdId"].notna().to_numpy()
+        ad_ids = batch["AdId"][identified].tolist()
+        columns = []
+        for column in DIMENSIONS.values():
+            codes, uniques = pd.factorize(batch[column].astype(object), use_na_sentinel=False)
+            columns.append((codes, [None if pd.isna(value) else value for value in uniques]))
+        for name, (codes, uniques) in zip(DIMENSIONS, columns):
+            postings = self.__index[name]
+            for code, ad_id in zip(codes[identified].tolist(), ad_ids):
+                postings[uniques[code]].add(ad_id)
+        self.__ads.update(ad_ids)
+        self.rows += len(batch)
+        # Every row gets the code of its combination of dimension values in each rollup, so the aggregates of a rollup are
+        # updated once per distinct key of the batch rather than once per row.
+        rollups = []
+        for subset in self.__rollups:
+            combined = np.zeros(len(batch), dtype=np.int64)
+            for i in subset:
+                combined = combined * len(columns[i][1]) + columns[i][0]
+            _, first, codes = np.unique(combined, return_index=True, return_inverse=True)
+            keys = [tuple(columns[i][1][columns[i][0][row]] for i in subset) for row in first.tolist()]
+            rollups.append((subset, codes.reshape(-1), keys))
+        for measure in self.measures:
+            self.__fold(measure, batch[measure], rollups)
+
+    def __fold(self, measure: str, values: pd.Series, rollups: list):
+        valid = values.notna().to_numpy()
+        values = values[valid].to_numpy(dtype=np.float64)
+        if not len(values):
+            return
+        buckets, bucket_codes = np.unique(QuantileSketch(self.relative_accuracy).bucket(values), return_inverse=True)
+        bucket_codes = bucket_codes.reshape(-1)
+        for subset, codes, uniques in rollups:
+            codes, groups = codes[valid], len(uniques)
+            counts = np.bincount(codes, minlength=groups)
+            totals = np.bincount(codes, weights=values, minlength=groups)
+            minimums = np.full(groups, np.inf)
+            maximums = np.full(groups, -np.inf)
+            np.minimum.at(minimums, codes, values)
+            np.maximum.at(maximums, codes, values)
+            # Bucket counts of every key: (key, bucket) pairs sorted by key, cut at the key boundaries.
+            pairs, pair_counts = np.unique(codes * len(buckets) + bucket_codes, return_counts=True)
+            pair_keys = pairs // len(buckets)
+            ends = (np.flatnonzero(np.diff(pair_keys)) + 1).tolist() + [len(pairs)]
+            pair_keys, pair_buckets, pair_counts = pair_keys.tolist(), buckets[pairs % len(buckets)].tolist(), pair_counts.tolist()
+            counts, totals, minimums, maximums = counts.tolist(), totals.tolist(), minimums.tolist(), maximums.tolist()
+            table = self.__aggregates[(measure, subset)]
+            start = 0
+            for end in ends:
+                code = pair_keys[start]
+                aggregate = table.get(uniques[code])
+                if aggregate is None:
+                    aggregate = table[uniques[code]] = Aggregate(self.relative_accuracy)
+                aggregate.update(counts[code], totals[code], minimums[code], maximums[code])
+                aggregate.sketch.add_counts(pair_buckets[start:end], pair_counts[start:end])
+                start = end
+
+    @staticmethod
+    def __subset(dimensions) -> tuple:
+        unknown = set(dimensions) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown dimensions {sorted(unknown)}, expected some of {list(DIMENSIONS)}")
+        names = list(DIMENSIONS)
+        return tuple(sorted(names.index(name) for name in dimensions))
+
+    def __lookup(self, measure: str, filters: dict) -> Aggregate:
+        subset = self.__subset(filters)
+        names = list(DIMENSIONS)
+        key = tuple(filters[names[i]] for i in subset)
+        return self.__aggregates[(measure, subset)].get(key)
+
+    def stats(self, measure: str = "Price_euro", **filters) -> dict:
+        """
+        Returns the aggregates of a measure for the adverts matching the filters.
+
+        Parameters:
+            * measure(str): one of the measures of the index.
+            * filters: values of the dimensions, e.g. marque="BMW 530", year=2010, fuel="Diesel", gearbox="Automatic";
+              without filters, the whole market.
+
+        Returns:
+            * stats(dict): count, mean, median, min and max; the median is approximate within relative_accuracy.
+        """
+        aggregate = self.__lookup(measure, filters)
+        return (aggregate or Aggregate(self.relative_accuracy)).as_dict()
+
+    def quantile(self, q: float, measure: str = "Price_euro", **filters) -> float:
+        """
+        Returns the approximate q quantile of a measure for the adverts matching the filters, e.g. quantile(0.9, fuel="Diesel").
+        """
+        aggregate = self.__lookup(measure, filters)
+        return aggregate.sketch.quantile(q) if aggregate is not None else None
+
+    def table(self, *dimensions, measure: str = "Price_euro") -> pd.DataFrame:
+        """
+        Returns the aggregates of a measure for every combination of values of the given dimensions, e.g.
+        table("marque", "year") for the median price by marque and year, most common combinations first.
+        """
+        subset = self.__subset(dimensions)
+        columns = [list(DIMENSIONS)[i] for i in subset]
+        rows = [
+            {**dict(zip(columns, key)), **aggregate.as_dict()}
+            for key, aggregate in self.__aggregates[(measure, subset)].items()
+        ]
+        frame = pd.DataFrame(rows, columns=[*columns, "count", "mean", "median", "min", "max"])
+        return frame.sort_values("count", ascending=False, kind="stable").reset_index(drop=True)
+
+    def ad_ids(self, **filters) -> list:
+        """
+        Returns the sorted IDs of the indexed adverts matching the filters, found by intersecting the dimension indexes.
+        """
+        self.__subset(filters)
+        if not filters:
+            return sorted(self.__ads)
+        postings = sorted((self.__index[name].get(value, set()) for name, value in filters.items()), key=len)
+        return sorted(set.intersection(*postings))
+
+    def close(self):
+        pass
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import os
+from function.lazy import LazyModule
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+
+class SeenIndex:
+    """
+    Set of ad IDs which have already been collected. With a path, the index is loaded from and appended to a text file
+    with one ID per line, so duplicates are also dropped across runs. New IDs are kept in memory until flush().
+
+    Parameters:
+        * path(str): the index file; None keeps the index in memory for a single run.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.__ids = set()
+        self.__pending = []
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.__ids.update(int(line) for line in f if line.strip())
+
+    def __len__(self) -> int:
+        return len(self.__ids)
+
+    def __contains__(self, ad_id: int) -> bool:
+        return ad_id in self.__ids
+
+    def admit(self, ad_ids) -> np.ndarray:
+        """
+        Marks the IDs as seen and tells which of them are new. Repeated IDs within ad_ids are admitted once,
+        and adverts without an ID are always admitted.
+
+        Parameters:
+            * ad_ids: a sequence of ad IDs, e.g. the AdId column of a normalized page.
+
+        Returns:
+            * new(np.ndarray): boolean mask of the rows to keep.
+        """
+        ids = self.__ids
+        new = np.ones(len(ad_ids), dtype=np.bool_)
+        for position, ad_id in enumerate(ad_ids):
+            if pd.isna(ad_id):
+                continue
+            ad_id = int(ad_id)
+            if ad_id in ids:
+                new[position] = False
+            else:
+                ids.add(ad_id)
+                self.__pending.append(ad_id)
+        return new
+
+    def pending(self) -> list:
+        """
+        Returns the IDs admitted since the last flush.
+        """
+        return list(self.__pending)
+
+    def flush(self):
+        """
+        Appends the IDs admitted since the last flush to the index file.
+        """
+        if self.path is None or not self.__pending:
+            self.__pending = []
+            return
+        with open(self.path, "a") as f:
+            f.write("".join(f"{ad_id}\n" for ad_id in self.__pending))
+        self.__pending = []
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import sqlite3
+from datetime import datetime, timezone
+from function.lazy import LazyModule
+from function.normalize import COLUMNS, SOURCES
+
+pd = LazyModule("pandas")
+
+
+class CsvSink:
+    """
+    Appends page batches to a .csv file as they arrive, so a crawl keeps at most one page in memory and a crash loses
+    only the page in progress. The header is written once, when the file is new or empty.
+
+    Parameters:
+        * path(str): the .csv file to write.
+        * append(bool): keep the existing rows of path instead of starting a new file.
+    """
+
+    def __init__(self, path: str = "autoplius.csv", append: bool = False):
+        self.path = path
+        self.rows = 0
+        self.__file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        self.__header = self.__file.tell() == 0
+
+    def write(self, batch: pd.DataFrame):
+        batch.to_csv(self.__file, header=self.__header, index=False)
+        self.__file.flush()
+        self.__header = False
+        self.rows += len(batch)
+
+    def close(self):
+        if not self.__file.closed:
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# SQLite column type of every dtype of function.normalize.SOURCES.
+SQLITE_TYPES = {"category": "TEXT", "Int64": "INTEGER", "Float64": "REAL"}
+
+ATTRIBUTES = tuple(column for column in COLUMNS if column != "AdId")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class SqliteSink:
+    """
+    Keeps the scraped adverts in a SQLite database keyed on the ad ID instead of overwriting a .csv file. Every batch is written
+    in one transaction with executemany upserts: the ads table holds the latest attributes of every advert with the times it
+    was first and last seen, and the ad_history table holds one row per distinct price and mileage of an advert with the times
+    that combination was first and last seen, so price changes can be queried later. Adverts without an ID are skipped.
+
+    Parameters:
+        * path(str): the database file, created when missing.
+        * clock: callable returning the timestamp of a batch, the current UTC time in ISO format by default.
+    """
+
+    def __init__(self, path: str = "autoplius.db", clock=None):
+        self.path = path
+        self.rows = 0
+        self.skipped = 0
+        self.__clock = clock or _now
+        self.__db = sqlite3.connect(path)
+        columns = ", ".join(f"{name} {SQLITE_TYPES[SOURCES[name][1]]}" for name in ATTRIBUTES)
+        self.__db.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS ads (
+                AdId INTEGER PRIMARY KEY,
+                {columns},
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ads_last_seen ON ads (last_seen);
+            CREATE INDEX IF NOT EXISTS ads_marque ON ads (Marque, ManufacturingDate);
+            CREATE TABLE IF NOT EXISTS ad_history (
+                id INTEGER PRIMARY KEY,
+                AdId INTEGER NOT NULL,
+                Price_euro INTEGER,
+                Mileage_km INTEGER,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ad_history_ad ON ad_history (AdId, id);
+            """
+        )
+        names = ", ".join(ATTRIBUTES)
+        self.__upsert = (
+            f"INSERT INTO ads (AdId, {names}, first_seen, last_seen) VALUES (?, {', '.join('?' * len(ATTRIBUTES))}, ?, ?) "
+            f"ON CONFLICT (AdId) DO UPDATE SET {', '.join(f'{name} = excluded.{name}' for name in ATTRIBUTES)}, "
+            "last_seen = excluded.last_seen"
+        )
+
+    def write(self, batch: pd.DataFrame):
+        seen_at = self.__clock()
+        values = {column: batch[column].to_numpy(dtype=object, na_value=None) for column in COLUMNS}
+        keep = [ad_id is not None for ad_id in values["AdId"]]
+        rows = [
+            row
+            for row, kept in zip(zip(*(values[column] for column in ("AdId",) + ATTRIBUTES)), keep)
+            if kept
+        ]
+        history = [
+            (ad_id, price, mileage)
+            for ad_id, price, mileage, kept in zip(values["AdId"], values["Price_euro"], values["Mileage_km"], keep)
+            if kept
+        ]
+        with self.__db:
+            self.__db.executemany(self.__upsert, [row + (seen_at, seen_at) for row in rows])
+            # A new price/mileage combination opens a history row; then the latest row of every advert is marked as seen.
+            self.__db.executemany(
+                "INSERT INTO ad_history (AdId, Price_euro, Mileage_km, first_seen, last_seen) SELECT ?1, ?2, ?3, ?4, ?4 "
+                "WHERE NOT EXISTS (SELECT 1 FROM ad_history WHERE id = "
+                "(SELECT MAX(id) FROM ad_history WHERE AdId = ?1) AND Price_euro IS ?2 AND Mileage_km IS ?3)",
+                [entry + (seen_at,) for entry in history],
+            )
+            self.__db.executemany(
+                "UPDATE ad_history SET last_seen = ?2 WHERE id = (SELECT MAX(id) FROM ad_history WHERE AdId = ?1)",
+                [(entry[0], seen_at) for entry in history],
+            )
+        self.rows += len(rows)
+        self.skipped += len(batch) - len(rows)
+
+    def history(self, ad_id: int) -> pd.DataFrame:
+        """
+        Returns the price and mileage history of an advert, oldest first, with first_seen and last_seen columns.
+        """
+        return pd.read_sql_query(
+            "SELECT Price_euro, Mileage_km, first_seen, last_seen FROM ad_history WHERE AdId = ? ORDER BY id",
+            self.__db,
+            params=(int(ad_id),),
+        )
+
+    def close(self):
+        self.__db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def drain(batches, *sinks) -> int:
+    """
+    Writes every batch to each of the sinks and closes the sinks at the end, even if the crawl fails.
+
+    Parameters:
+        * batches: an iterable of pd.DataFrame batches, e.g. autoplius_scraper.iter_pages().
+        * sinks: objects with write(batch) and close() methods.
+
+    Returns:
+        * rows(int): the number of rows written to every sink.
+    """
+    rows = 0
+    try:
+        for batch in batches:
+            for sink in sinks:
+                sink.write(batch)
+            rows += len(batch)
+    finally:
+        for sink in sinks:
+            sink.close()
+    return rows
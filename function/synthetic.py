@@ -0,0 +1,254 @@
+import random
+
+MODELS = (
+    ("Ford", "Transit Connect", "commercial"),
+    ("BMW", "530", "wagon"),
+    ("Citroen", "Jumper", "commercial"),
+    ("Audi", "S6", "saloon / sedan"),
+    ("Volkswagen", "Golf", "hatchback"),
+    ("Toyota", "RAV4", "SUV / off-road"),
+    ("Skoda", "Octavia", "wagon"),
+    ("Opel", "Astra", "hatchback"),
+    ("Volvo", "XC90", "SUV / off-road"),
+    ("Mercedes-Benz", "E220", "saloon / sedan"),
+)
+FUELS = ("Diesel", "Petrol", "Petrol / LPG", "Hybrid", "Electric")
+GEARBOXES = ("Manual", "Automatic")
+CITIES = ("Vilnius", "Kaunas", "Klaipeda", "Siauliai", "Panevezys")
+COLOURS = ("Black", "White", "Grey", "Silver", "Blue", "Red", "Green")
+DEFECTS = ("Without defects", "Without defects", "Damaged", "Burned", "Flooded")
+DRIVE_WHEELS = ("Front wheel drive (FWD)", "Rear wheel drive (RWD)", "All wheel drive (4x4)")
+COUNTRIES = ("Lithuania", "Germany", "Netherlands", "Belgium", "France")
+BASE_URL = "https://en.autoplius.lt"
+
+AD = """        <a class="announcement-item{highlight}" href="{base_url}/ads/used-cars/{slug}/{slug}-{year}-{fuel_slug}-{ad_id}.html">
+            <div class="announcement-media">
+                <img src="https://autoplius-img.dgn.lt/ann_2_{ad_id}/{slug}.jpg" alt="{name}">
+            </div>
+            <div class="announcement-body">
+                <div class="announcement-title">
+                    {title}        </div>
+                <div class="announcement-title-parameters">
+                    <div class="bottom-aligner">
+                        <span title="Date of manufacture">{year}-{month:02d}</span>
+                        <span title="Fuel type">{fuel}</span>
+                        <span title="Gearbox">{gearbox}</span>
+{power}                    </div>
+                </div>
+                <div class="announcement-parameters-block">
+                    <div class="announcement-parameters">
+{mileage}                        <span title="City">{city}</span>
+                    </div>
+                </div>
+                <div class="announcement-pricing-info">
+                    {price}
+                </div>
+            </div>
+        </a>
+"""
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="utf-8">
+    <title>Used cars for sale | autoplius.lt</title>
+</head>
+<body>
+<div class="page-wrapper">
+    <div class="search-list-title">Used cars</div>
+    <div class="auto-lists lt">
+{ads}    </div>
+    <div class="paging">
+        <a class="page" href="{base_url}/ads/used-cars?page_nr={next_page}">{next_page}</a>
+    </div>
+</div>
+</body>
+</html>
+"""
+
+
+def _thousands(number: int) -> str:
+    return f"{number:,}".replace(",", " ")
+
+
+def synthetic_attributes(rng: random.Random) -> dict:
+    """
+    Draws the attributes of one advert. About one advert in twenty lacks the power, mileage or price, like real listings do,
+    so the failure paths of normalization are exercised as well.
+
+    Parameters:
+        * rng(random.Random): source of the advert attributes.
+
+    Returns:
+        * attributes(dict): make_id (position in MODELS + 1), marque, model, car_type, fuel, engine, power, mileage,
+          highlighted, year, month, gearbox, city and price; missing values are None.
+    """
+    model = rng.choice(MODELS)
+    attributes = {
+        "make_id": MODELS.index(model) + 1,
+        "marque": model[0],
+        "model": model[1],
+        "car_type": model[2],
+        "fuel": rng.choice(FUELS),
+        "engine": rng.randint(10, 45) / 10,
+        "power": rng.randint(40, 400),
+        "mileage": rng.randint(0, 450000),
+        "highlighted": rng.random() < 0.1,
+        "year": rng.randint(1995, 2024),
+        "month": rng.randint(1, 12),
+        "gearbox": rng.choice(GEARBOXES),
+    }
+    if rng.random() < 0.05:
+        attributes["power"] = None
+    if rng.random() < 0.05:
+        attributes["mileage"] = None
+    attributes["city"] = rng.choice(CITIES)
+    attributes["price"] = None if rng.random() < 0.05 else rng.randint(500, 90000)
+    return attributes
+
+
+def render_ad(ad_id: int, attributes: dict, base_url: str = BASE_URL) -> str:
+    """
+    Renders an advert with the given attributes in the markup of en.autoplius.lt listing pages.
+
+    Parameters:
+        * ad_id(int): the ID at the end of the advert link.
+        * attributes(dict): the advert attributes, see synthetic_attributes().
+        * base_url(str): the website the advert links to.
+
+    Returns:
+        * ad(str): html code of the announcement-item anchor.
+    """
+    name = f"{attributes['marque']} {attributes['model']}"
+    fuel = attributes["fuel"]
+    power, mileage, price = attributes["power"], attributes["mileage"], attributes["price"]
+    return AD.format(
+        highlight=" is-highlighted" if attributes["highlighted"] else "",
+        base_url=base_url,
+        slug=name.lower().replace(" ", "-"),
+        fuel_slug=fuel.lower().replace(" / ", "-"),
+        ad_id=ad_id,
+        name=name,
+        title=name if fuel == "Electric" else f"{name}, {attributes['engine']:.1f} l., {attributes['car_type']}",
+        year=attributes["year"],
+        month=attributes["month"],
+        fuel=fuel,
+        gearbox=attributes["gearbox"],
+        power="" if power is None else f'                        <span title="Power">{power} kW</span>\n',
+        mileage="" if mileage is None else f'                        <span title="Mileage">{_thousands(mileage)} km</span>\n',
+        city=attributes["city"],
+        price="Price on request" if price is None else f"{_thousands(price)} €",
+    )
+
+
+def synthetic_ad(ad_id: int, rng: random.Random, base_url: str = BASE_URL) -> str:
+    """
+    Renders one advert with random attributes (see synthetic_attributes()) in the markup of en.autoplius.lt listing pages.
+
+    Parameters:
+        * ad_id(int): the ID at the end of the advert link.
+        * rng(random.Random): source of the advert attributes.
+        * base_url(str): the website the advert links to.
+
+    Returns:
+        * ad(str): html code of the announcement-item anchor.
+    """
+    return render_ad(ad_id, synthetic_attributes(rng), base_url)
+
+
+def synthetic_page(
+    ads: int = 20, page_no: int = 1, seed: int = 0, first_id: int = 30000000, base_url: str = BASE_URL
+) -> bytes:
+    """
+    Generates a listing page with the given number of adverts, e.g. to benchmark the scraper at thousands of adverts
+    per page or to serve it from a local test server. Pages are reproducible: the same arguments give the same bytes.
+
+    Parameters:
+        * ads(int): the number of adverts on the page.
+        * page_no(int): the page number; ad IDs continue from first_id + (page_no - 1) * ads.
+        * seed(int): seed of the advert attributes.
+        * first_id(int): the ad ID of the first advert of page 1.
+        * base_url(str): the website the adverts and the paging link point to.
+
+    Returns:
+        * content(bytes): html code of the page, UTF-8 encoded.
+    """
+    rng = random.Random(f"{seed}:{page_no}")
+    start = first_id + (page_no - 1) * ads
+    body = "".join(synthetic_ad(ad_id, rng, base_url) for ad_id in range(start, start + ads))
+    return PAGE.format(ads=body, next_page=page_no + 1, base_url=base_url).encode("utf-8")
+
+
+def advert_attributes(ad_id: int, seed: int = 0) -> dict:
+    """
+    Returns the attributes of the advert with the given ID on synthetic_listing() pages; they depend on the ID only.
+    """
+    return synthetic_attributes(random.Random(f"{seed}:ad:{ad_id}"))
+
+
+def synthetic_listing(ad_ids, page_no: int = 1, seed: int = 0, base_url: str = BASE_URL) -> bytes:
+    """
+    Generates a listing page with the given adverts. The attributes of every advert depend on its ID only, so an advert
+    looks the same on whichever page it appears, e.g. when new listings push it to the next page.
+
+    Parameters:
+        * ad_ids: the ad IDs in page order.
+        * page_no(int): the page number, used for the paging link.
+        * seed(int): seed of the advert attributes.
+        * base_url(str): the website the adverts and the paging link point to.
+
+    Returns:
+        * content(bytes): html code of the page, UTF-8 encoded.
+    """
+    body = "".join(render_ad(ad_id, advert_attributes(ad_id, seed), base_url) for ad_id in ad_ids)
+    return PAGE.format(ads=body, next_page=page_no + 1, base_url=base_url).encode("utf-8")
+
+
+DETAIL = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="utf-8">
+    <title>Advert {ad_id} | autoplius.lt</title>
+</head>
+<body>
+<div class="page-wrapper">
+    <div class="announcement-parameters">
+{rows}    </div>
+</div>
+</body>
+</html>
+"""
+
+ROW = """        <div class="parameter-row">
+            <div class="parameter-label">{label}</div>
+            <div class="parameter-value">{value}</div>
+        </div>
+"""
+
+
+def synthetic_detail(ad_id: int, seed: int = 0) -> bytes:
+    """
+    Generates the detail page of an advert with its parameter table (colour, defects, location, VIN and more), in the
+    parameter-row markup read by function.enrich.
+
+    Parameters:
+        * ad_id(int): the ad ID.
+        * seed(int): seed of the advert attributes.
+
+    Returns:
+        * content(bytes): html code of the page, UTF-8 encoded.
+    """
+    rng = random.Random(f"{seed}:detail:{ad_id}")
+    parameters = {
+        "Colour": rng.choice(COLOURS),
+        "Defects": rng.choice(DEFECTS),
+        "Location": f"{rng.choice(CITIES)}, Lithuania",
+        "Number of doors": str(rng.choice((2, 4, 5))),
+        "Drive wheels": rng.choice(DRIVE_WHEELS),
+        "First registration country": rng.choice(COUNTRIES),
+        "VIN code": "".join(rng.choice("ABCDEFGHJKLMNPRSTUVWXYZ0123456789") for _ in range(17)),
+    }
+    if rng.random() < 0.2:
+        del parameters["VIN code"]
+    rows = "".join(ROW.format(label=label, value=value) for label, value in parameters.items())
+    return DETAIL.format(ad_id=ad_id, rows=rows).encode("utf-8")
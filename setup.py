@@ -12,6 +12,9 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type='ext/markdown',
     packages=setuptools.find_packages(),
+    entry_points={
+        "console_scripts": ["autoplius-scraper=function.cli:main"],
+    },
     classifiers=(
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
@@ -1,17 +1,49 @@
 from function.autoplius_scraper import autoplius_scraper
+from function.export import DatasetSink, read_dataset
+from function.extractor import extractor
+from function.normalize import normalize_records
+from function.fetch import AdaptiveRateLimiter, FetchError, RateLimiter, Transport, fetch_pages, retry_after_seconds
+from function.buffers import ColumnBuffers
+from function.cache import CacheMiss, ResponseCache
+from function.checkpoint import Checkpoint
+from function.metrics import CrawlStats
+from function.benchmark import bench_cold_start, compare, filled_scraper, run as run_benchmark
+from function.cli import main as cli
+from function.synthetic import advert_attributes, synthetic_detail, synthetic_page
+from function.fake_server import FakeListingServer, load_test
+from function.enrich import DETAIL_COLUMNS, DetailEnricher, parse_detail
+from function.listing import ListingQuery
+from function.distributed import WorkQueue, merge_results, run_worker
+from function.diff import diff_snapshots, read_snapshot, write_snapshot
+from function.query import MarketIndex
+from function.seen import SeenIndex
+from function.sinks import CsvSink, SqliteSink, drain
+from function.parsing import available_parsers, extract_page
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from bs4 import BeautifulSoup
 import requests
+import sqlite3
+import gzip
 import pytest
+import os
+import threading
+import time
 import pandas as pd
 
+fixture = os.path.join(os.path.dirname(__file__), "fixtures", "used-cars_page_nr_1.html")
+
 url = "https://en.autoplius.lt/ads/used-cars?page_nr=1"
 
 def test_getPageNo():
     scraper = autoplius_scraper()
     assert scraper.getPageNo(100) == 5
 
-def test_scrape_page():
-    scraper = autoplius_scraper()
+def test_scrape_page(tmp_path):
+    cache = ResponseCache(str(tmp_path), offline=True)
+    with open(fixture, "rb") as f:
+        cache.put(url, f.read())
+    scraper = autoplius_scraper(cache=cache)
     scraped_webpage = scraper.scrape_page(url)
     assert isinstance(scraped_webpage, BeautifulSoup)
 
@@ -28,3 +60,716 @@ def test_into_csv():
     scraper.into_pandas()
     assert scraper.into_csv() == "Pandas dataframe has been successfully exported to the directory as autoplius.csv"
 
+
+def test_extract_records():
+    with open(fixture, "rb") as f:
+        cars = BeautifulSoup(f.read(), "html.parser").find_all("a", class_="announcement-item")
+    records = extractor.extract_all(cars)
+    assert len(records) == 5
+    assert records[0][extractor.columns.index("title")].strip() == "Ford Transit Connect, 1.8 l., commercial"
+    assert records[0][extractor.columns.index("mileage")] == "278 154 km"
+    assert records[2][extractor.columns.index("power")] is None
+    assert records[4][extractor.columns.index("mileage")] is None
+
+def test_normalize_records():
+    with open(fixture, "rb") as f:
+        cars = BeautifulSoup(f.read(), "html.parser").find_all("a", class_="announcement-item")
+    frame, failures = normalize_records(extractor.extract_all(cars))
+    assert frame.iloc[0].tolist() == ["Ford Transit Connect", "commercial", "Diesel", "Manual", 2013, 1.8, 66, 278154, 2200, 17410251]
+    assert frame["CarType"].iloc[3] == "saloon / sedan" and pd.isna(frame["CarType"].iloc[4])
+    assert pd.isna(frame["Engine_l"].iloc[4])
+    assert failures[["row", "column", "reason"]].values.tolist() == [
+        [2, "Power_kW", "missing"],
+        [4, "Mileage_km", "missing"],
+        [4, "Price_euro", "unparsed"],
+    ]
+
+@pytest.fixture
+def listing_server():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with open(fixture, "rb") as f:
+                body = f.read().replace(b"Used cars", self.path.encode())
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def test_fetch_pages_in_order(listing_server):
+    urls = [f"{listing_server}/ads/used-cars?page_nr={i}" for i in range(1, 9)]
+    pages = list(fetch_pages(urls, Transport(limiter=RateLimiter(200)), concurrency=4))
+    assert [url for url, _ in pages] == urls
+    for url, page in pages:
+        assert url.replace(listing_server, "").encode() in page.content
+
+def test_crawl_stats_count_wire_bytes():
+    with open(fixture, "rb") as f:
+        body = f.read()
+    compressed = gzip.compress(body)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(compressed)))
+            self.end_headers()
+            self.wfile.write(compressed)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stats = CrawlStats()
+    try:
+        ((_, page),) = fetch_pages([f"http://127.0.0.1:{server.server_address[1]}/"], Transport(), stats=stats)
+    finally:
+        server.shutdown()
+    assert page.content == body and page.wire_bytes == len(compressed)
+    assert stats.bytes_downloaded == len(compressed)
+
+def test_truncated_response_is_retried():
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            self.send_response(200)
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            # the first response is cut off after half of its body
+            self.wfile.write(b"x" * (500 if len(hits) == 1 else 1000))
+            self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        page = Transport(backoff=0.001).get(f"http://127.0.0.1:{server.server_address[1]}/")
+    finally:
+        server.shutdown()
+    assert page.ok and page.attempts == 2 and len(page.content) == 1000 and len(hits) == 2
+
+def test_rate_limiter():
+    limiter = RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+    assert time.monotonic() - start >= 0.09
+
+@pytest.mark.parametrize("parser", available_parsers())
+@pytest.mark.parametrize("only_announcements", [False, True])
+def test_parser_backends_give_identical_records(parser, only_announcements):
+    with open(fixture, "rb") as f:
+        content = f.read()
+    scraper = autoplius_scraper(parser=parser, only_announcements=only_announcements)
+    scraper.parse_page(content)
+    scraper.find_announcements()
+    reference = extractor.extract_all(BeautifulSoup(content, "html.parser").find_all("a", class_="announcement-item"))
+    assert scraper.extract_records() == reference
+
+def test_extract_page_in_worker_process():
+    with open(fixture, "rb") as f:
+        content = f.read()
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        records = pool.submit(extract_page, content, "html.parser", True).result()
+    assert records == extract_page(content)
+    assert len(records) == 5
+
+def test_offline_replay(tmp_path):
+    cache = offline_cache(tmp_path, 2)
+    scraper = autoplius_scraper(cache=cache)
+    scraper.multiple_scrapes(40)
+    assert len(scraper.into_pandas()) == 10
+    assert cache.hits == 2
+    with pytest.raises(CacheMiss):
+        scraper.scrape_page("https://en.autoplius.lt/ads/used-cars?page_nr=3")
+
+def test_cache_revalidation(tmp_path):
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.headers.get("If-None-Match"))
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = b"<html>v1</html>"
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    page_url = f"http://127.0.0.1:{server.server_address[1]}/ads/used-cars?page_nr=1"
+    cache = ResponseCache(str(tmp_path), ttl=0)
+    transport = Transport()
+    assert cache.fetch(transport, page_url).content == b"<html>v1</html>"
+    assert cache.fetch(transport, page_url).content == b"<html>v1</html>"
+    server.shutdown()
+    assert requests_seen == [None, '"v1"']
+    assert cache.revalidated == 1
+
+def test_cache_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=250)
+    for i in range(5):
+        cache.put(f"https://en.autoplius.lt/ads/used-cars?page_nr={i}", bytes([i]) * 100)
+        time.sleep(0.01)
+    assert cache.lookup("https://en.autoplius.lt/ads/used-cars?page_nr=0") is None
+    assert cache.lookup("https://en.autoplius.lt/ads/used-cars?page_nr=4") is not None
+    assert sum(f.stat().st_size for f in (tmp_path / "bodies").iterdir()) <= 250
+
+def offline_cache(directory, pages):
+    cache = ResponseCache(str(directory), offline=True)
+    with open(fixture, "rb") as f:
+        content = f.read()
+    for i in range(1, pages + 1):
+        # every page gets its own ad IDs, e.g. ...-17410251.html becomes ...-174102512.html on page 2
+        page = content.replace(b'.html"', f'{i}.html"'.encode())
+        cache.put(f"https://en.autoplius.lt/ads/used-cars?page_nr={i}", page)
+    return cache
+
+def test_iter_pages_into_csv_sink(tmp_path):
+    cache = offline_cache(tmp_path / "cache", 3)
+    scraper = autoplius_scraper(cache=cache)
+    batches = scraper.iter_pages(60)
+    rows = drain(batches, CsvSink(str(tmp_path / "stream.csv")))
+    assert rows == 15
+    streamed = pd.read_csv(tmp_path / "stream.csv")
+    scraper = autoplius_scraper(cache=cache)
+    scraper.multiple_scrapes(60)
+    scraper.into_pandas().to_csv(tmp_path / "batch.csv", index=False)
+    pd.testing.assert_frame_equal(streamed, pd.read_csv(tmp_path / "batch.csv"))
+
+def test_iter_records(tmp_path):
+    scraper = autoplius_scraper(cache=offline_cache(tmp_path, 1))
+    records = list(scraper.iter_records(20))
+    assert len(records) == 5
+    assert records[1]["Marque"] == "BMW 530"
+
+def test_into_pandas_dtypes(tmp_path):
+    scraper = autoplius_scraper(cache=offline_cache(tmp_path, 2))
+    scraper.multiple_scrapes(40)
+    result = scraper.into_pandas()
+    assert len(result) == 10
+    assert isinstance(result["Marque"].dtype, pd.CategoricalDtype)
+    assert sorted(result["Marque"].cat.categories) == ["Audi S6", "BMW 530", "Citroen Jumper", "Ford Transit Connect", "Tesla Model 3"]
+    assert str(result["Price_euro"].dtype) == "Int64"
+    assert str(result["Engine_l"].dtype) == "Float64"
+    assert result["Price_euro"].tolist()[:4] == [2200, 3300, 4800, 29600]
+    assert result["Price_euro"].isna().tolist()[:5] == [False, False, False, False, True]
+    assert result["CarType"].iloc[0] == "commercial"
+    assert result["Engine_l"].iloc[1] == 3.0
+
+def test_column_buffers_grow_without_touching_earlier_frames():
+    with open(fixture, "rb") as f:
+        page = normalize_records(extract_page(f.read())).frame
+    buffers = ColumnBuffers()
+    buffers.extend_frame(page)
+    first = buffers.to_pandas()
+    for _ in range(30):
+        buffers.extend_frame(page)
+    assert len(first) == 5 and first["Price_euro"].iloc[3] == 29600
+    assert len(buffers.to_pandas()) == 155
+    assert sorted(buffers.to_pandas()["Marque"].cat.categories) == sorted(page["Marque"])
+    frame = buffers.to_pandas()
+    with pytest.raises(ValueError):
+        frame.loc[0, "Price_euro"] = 1
+    with pytest.raises(ValueError):
+        frame["Price_euro"].array[0] = 1
+    frame.loc[0, "Marque"] = frame.loc[1, "Marque"]
+    copy = buffers.to_pandas().copy()
+    copy.loc[0, "Price_euro"] = 1
+    assert buffers.to_pandas().loc[0, ["Marque", "Price_euro"]].tolist() == first.loc[0, ["Marque", "Price_euro"]].tolist()
+
+def test_failures_report(tmp_path):
+    scraper = autoplius_scraper(cache=offline_cache(tmp_path, 2))
+    scraper.multiple_scrapes(40)
+    failures = scraper.failures()
+    assert failures["row"].tolist() == [2, 4, 4, 7, 9, 9]
+    assert failures["reason"].value_counts().to_dict() == {"missing": 4, "unparsed": 2}
+
+def test_into_parquet_and_feather(tmp_path):
+    pytest.importorskip("pyarrow")
+    scraper = autoplius_scraper(cache=offline_cache(tmp_path / "cache", 2))
+    scraper.multiple_scrapes(40)
+    result = scraper.into_pandas()
+    scraper.into_parquet(str(tmp_path / "autoplius.parquet"))
+    scraper.into_feather(str(tmp_path / "autoplius.feather"))
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "autoplius.parquet"), result)
+    pd.testing.assert_frame_equal(pd.read_feather(tmp_path / "autoplius.feather"), result)
+
+def test_partitioned_dataset_appends(tmp_path):
+    pytest.importorskip("pyarrow")
+    scraper = autoplius_scraper(cache=offline_cache(tmp_path / "cache", 1))
+    scraper.multiple_scrapes(20)
+    scraper.into_pandas()
+    dataset = tmp_path / "dataset"
+    scraper.into_parquet(str(dataset), partition=True)
+    first = sorted(dataset.rglob("*.parquet"))
+    drain(autoplius_scraper(cache=offline_cache(tmp_path / "cache", 1)).iter_pages(20), DatasetSink(str(dataset)))
+    files = sorted(dataset.rglob("*.parquet"))
+    assert len(files) == 2 * len(first) and set(first) <= set(files)
+    assert len({path.parent.name for path in files}) == 5
+    assert len(read_dataset(str(dataset))) == 10
+    # pages are buffered, so a streamed crawl writes one file per partition rather than one per page and partition
+    streamed = tmp_path / "streamed"
+    sink = DatasetSink(str(streamed))
+    drain(autoplius_scraper(cache=offline_cache(tmp_path / "cache2", 2)).iter_pages(40), sink)
+    assert sink.rows == 10 and len(list(streamed.rglob("*.parquet"))) == len(first)
+    assert len(read_dataset(str(streamed))) == 10
+
+def test_duplicates_dropped_within_and_across_runs(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), offline=True)
+    with open(fixture, "rb") as f:
+        content = f.read()
+    cache.put("https://en.autoplius.lt/ads/used-cars?page_nr=1", content)
+    # page 2 repeats the last two adverts of page 1 after a listing shift
+    cache.put("https://en.autoplius.lt/ads/used-cars?page_nr=2", content.replace(b'17405537.html"', b'27405537.html"'))
+    index = str(tmp_path / "seen.txt")
+    scraper = autoplius_scraper(cache=cache, seen=SeenIndex(index))
+    scraper.multiple_scrapes(40)
+    assert scraper.into_pandas()["AdId"].tolist() == [17410251, 17398822, 17405537, 17412984, 17413307, 27405537]
+    scraper = autoplius_scraper(cache=cache, seen=SeenIndex(index))
+    scraper.multiple_scrapes(40)
+    assert len(scraper.into_pandas()) == 0
+
+def test_incremental_crawl_stops_at_seen_page(tmp_path):
+    cache = offline_cache(tmp_path / "cache", 2)
+    index = SeenIndex(str(tmp_path / "seen.txt"))
+    autoplius_scraper(cache=cache, seen=index).multiple_scrapes(20)
+    scraper = autoplius_scraper(cache=cache, seen=SeenIndex(str(tmp_path / "seen.txt")))
+    # only two of the five requested pages are captured, so reaching page 3 would raise CacheMiss
+    scraper.multiple_scrapes(100, incremental=True)
+    assert len(scraper.into_pandas()) == 0
+
+def test_checkpoint_and_resume(tmp_path):
+    # only the first two of four pages are captured, so the crawl fails on page 3
+    checkpoint = Checkpoint(str(tmp_path / "crawl.checkpoint"), every=1)
+    scraper = autoplius_scraper(cache=offline_cache(tmp_path / "cache", 2))
+    with pytest.raises(CacheMiss):
+        scraper.multiple_scrapes(80, checkpoint=checkpoint)
+    state = checkpoint.load()
+    assert state["completed"] == 2 and len(state["columns"]) == 10
+    cache = offline_cache(tmp_path / "cache", 4)
+    scraper = autoplius_scraper(cache=cache)
+    scraper.multiple_scrapes(80, checkpoint=checkpoint, resume=True)
+    result = scraper.into_pandas()
+    assert len(result) == 20 and result["AdId"].is_unique
+    assert cache.hits == 2
+    assert checkpoint.load() is None
+
+def test_resume_retries_failed_pages(tmp_path):
+    pages = {page: synthetic_page(20, page_no=page, first_id=30000000 + 100 * page) for page in (2, 3)}
+    checkpoint = Checkpoint(str(tmp_path / "crawl.checkpoint"), every=1)
+
+    def crash(event):
+        if event["page"] == 2:
+            raise KeyboardInterrupt
+
+    with FakeListingServer(pages=pages) as server:
+        # page 1 is missing (404), then the crawl is interrupted on page 2
+        transport = Transport(limiter=RateLimiter(1000))
+        scraper = autoplius_scraper(transport=transport, base_url=server.base_url, stats=CrawlStats(hooks=[crash]))
+        with pytest.raises(KeyboardInterrupt):
+            scraper.multiple_scrapes(60, checkpoint=checkpoint)
+        state = checkpoint.load()
+        assert state["completed"] == 1 and [entry["page"] for entry in state["failed_pages"]] == [1]
+        pages[1] = synthetic_page(20, page_no=1, first_id=30000100)
+        scraper = autoplius_scraper(transport=transport, base_url=server.base_url)
+        scraper.multiple_scrapes(60, checkpoint=checkpoint, resume=True)
+    assert len(scraper.into_pandas()) == 60 and scraper.failed_pages().empty
+
+
+def test_adaptive_rate_limiter():
+    throttle = AdaptiveRateLimiter(rate=0.5, floor=0.1, ceiling=1.0, step=0.1)
+    for _ in range(10):
+        throttle.record(200, 0.1)
+    assert throttle.rate == 1.0
+    throttle.record(429, 0.1)
+    assert throttle.rate == 0.5
+    throttle.record(503, 0.1)
+    throttle.record(None, 0.1)
+    throttle.record(500, 0.1)
+    assert throttle.rate == 0.1
+    for _ in range(3):
+        throttle.record(200, 0.1)
+    rate = throttle.rate
+    throttle.record(200, 2.0)
+    assert throttle.rate < rate
+    assert throttle.effective_rate > 0
+
+def test_retry_after_pauses_requests():
+    throttle = AdaptiveRateLimiter(rate=100, ceiling=100)
+    throttle.record(429, 0.01, retry_after_seconds("0.2"))
+    start = time.monotonic()
+    throttle.wait()
+    assert time.monotonic() - start >= 0.15
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert retry_after_seconds(None) is None
+
+@pytest.fixture
+def flaky_server():
+    hits = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits[self.path] = hits.get(self.path, 0) + 1
+            if "page_nr=2" in self.path:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if "big" in self.path:
+                body = b"x" * 4096
+            elif hits[self.path] < 3:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            else:
+                with open(fixture, "rb") as f:
+                    body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", hits
+    server.shutdown()
+
+def test_transport_retries_and_limits(flaky_server):
+    base, hits = flaky_server
+    transport = Transport(retries=3, backoff=0.01, limiter=RateLimiter(500))
+    page = transport.get(f"{base}/ads/used-cars?page_nr=1")
+    assert page.ok and page.attempts == 3 and b"announcement-item" in page.content
+    missing = transport.get(f"{base}/ads/used-cars?page_nr=2")
+    assert not missing.ok and missing.status_code == 404 and missing.attempts == 1
+    assert "exceeds" in Transport(max_bytes=1024).get(f"{base}/big").error
+    scraper = autoplius_scraper(transport=Transport(retries=0, limiter=RateLimiter(500)))
+    with pytest.raises(FetchError):
+        scraper.scrape_page(f"{base}/ads/used-cars?page_nr=2")
+
+def test_crawl_stats(tmp_path):
+    pages = []
+    scraper = autoplius_scraper(cache=offline_cache(tmp_path, 2), stats=CrawlStats(hooks=[pages.append]))
+    scraper.multiple_scrapes(40)
+    scraper.into_pandas()
+    stats = scraper.crawl_stats().as_dict()
+    assert [page["ads"] for page in pages] == [5, 5]
+    assert stats["ads_per_page"] == 5 and stats["cache_hit_rate"] == 1.0
+    assert all(stats["stages"][stage]["calls"] >= 2 for stage in ("fetch", "parse", "find_announcements", "extract", "normalize"))
+    assert stats["stages"]["build"]["calls"] == 3
+    assert stats["field_failures"]["Power_kW:missing"] == 2
+    prometheus = scraper.crawl_stats().to_prometheus()
+    assert 'autoplius_stage_seconds_total{stage="parse",clock="cpu"}' in prometheus
+    assert "autoplius_pages_total 2" in prometheus
+
+def test_synthetic_page():
+    records = extract_page(synthetic_page(200, page_no=2))
+    frame = normalize_records(records).frame
+    assert len(frame) == 200 and frame["AdId"].is_unique and frame["AdId"].min() == 30000200
+    assert synthetic_page(20, seed=1) == synthetic_page(20, seed=1)
+
+def test_benchmark_results():
+    results = run_benchmark(sizes=(300,), repeat=1, stage_ads=50)
+    assert {"used-cars_page_nr_1.html", "synthetic_50"} <= set(results["stages"])
+    assert results["stages"]["synthetic_50"]["ads"] == 50
+    assert results["memory"][0]["rows"] == 300 and results["memory"][0]["peak_bytes"] > 0
+    assert all(entry["ratio"] == 1 for entry in compare(results, results))
+
+def test_fake_server_crawl_with_injected_errors():
+    with FakeListingServer(error_rate=0.3, throttle_rate=0.1, retry_after=0.01, seed=1) as server:
+        transport = Transport(retries=8, backoff=0.001, limiter=RateLimiter(1000))
+        scraper = autoplius_scraper(transport=transport, base_url=server.base_url)
+        scraper.multiple_scrapes(100, concurrency=4)
+        assert server.injected[503] > 0 and server.requests > 5
+    frame = scraper.into_pandas()
+    assert len(frame) == 100 and frame["AdId"].is_unique
+    assert scraper.failed_pages().empty
+
+def test_crawl_skips_failed_pages():
+    with FakeListingServer(error_rate=1.0) as server:
+        transport = Transport(retries=1, backoff=0.001, limiter=RateLimiter(1000))
+        scraper = autoplius_scraper(transport=transport, base_url=server.base_url)
+        scraper.multiple_scrapes(40)
+    failed = scraper.failed_pages()
+    assert failed["status"].tolist() == [503, 503] and failed["attempts"].tolist() == [2, 2]
+    assert len(scraper.into_pandas()) == 0
+    assert scraper.crawl_stats().pages == 0 and scraper.crawl_stats().failed_pages == 2
+
+def test_effective_rate_of_fixed_rate_crawl():
+    with FakeListingServer(total_ads=100) as server:
+        scraper = autoplius_scraper(base_url=server.base_url)
+        scraper.multiple_scrapes(100, rate=1000)
+    assert scraper.effective_rate() > 1 and scraper.crawl_stats().pages == 5
+
+def test_load_test_with_listing_churn():
+    with FakeListingServer(churn=5) as server:
+        results = load_test(server, 100, concurrency=2)
+    assert results["requests"] == 5 and results["failed_pages"] == 0
+    assert results["ads"] < 100 and results["ads_per_second"] > 0
+
+def test_parse_detail():
+    details = parse_detail(synthetic_detail(30000001))
+    assert set(details) <= set(DETAIL_COLUMNS) and {"Colour", "Defects", "Location"} <= set(details)
+
+def test_detail_enrichment():
+    with FakeListingServer(total_ads=40) as server:
+        enricher = DetailEnricher(Transport(limiter=RateLimiter(1000)), concurrency=4, per_host_rate=500)
+        scraper = autoplius_scraper(
+            transport=Transport(limiter=RateLimiter(1000)), base_url=server.base_url, enricher=enricher
+        )
+        scraper.multiple_scrapes(40, enrich=True)
+        requests_made = server.requests
+        assert len(scraper.enrich_details()) == 40
+        assert server.requests == requests_made
+    frame = scraper.into_pandas()
+    assert len(frame) == 40 and frame["Colour"].notna().all()
+    assert set(DETAIL_COLUMNS) <= set(frame.columns)
+    assert frame.loc[frame["AdId"] == 30000001, "Colour"].item() == parse_detail(synthetic_detail(30000001))["Colour"]
+
+def test_detail_enrichment_backs_off_per_host():
+    with FakeListingServer(total_ads=20, throttle_rate=0.3, retry_after=0) as server:
+        links = {ad_id: f"{server.base_url}/ads/used-cars/car-{ad_id}.html" for ad_id in range(30000001, 30000021)}
+        enricher = DetailEnricher(Transport(backoff=0, limiter=RateLimiter(1000)), concurrency=4, per_host_rate=500)
+        enricher.enrich(links)
+        assert server.injected[429] > 0
+    (rate,) = enricher.host_rates().values()
+    assert rate < 500
+
+def test_detail_enrichment_of_relative_links_from_offline_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), offline=True)
+    with open(fixture, "rb") as f:
+        cache.put(url, f.read().replace(b'href="https://en.autoplius.lt/', b'href="/'))
+    detail = "https://en.autoplius.lt/ads/used-cars/ford/ford-transit-connect-1-8-l-commercial-2013-diesel-17410251.html"
+    cache.put(detail, synthetic_detail(17410251))
+    scraper = autoplius_scraper(cache=cache)
+    scraper.multiple_scrapes(20)
+    # the other four detail pages are not cached and fail on their own
+    assert scraper.enrich_details()["AdId"].tolist() == [17410251]
+
+def test_listing_query():
+    query = ListingQuery().make(43).years(2010, 2015)
+    assert query.url(2) == "https://en.autoplius.lt/ads/used-cars?make_date_from=2010&make_date_to=2015&make_id=43&page_nr=2"
+    assert ListingQuery().url(1) == url
+    bands = query.price(1500, None).split_price((0, 1000, 2000, 5000))
+    assert [(band.filters["sell_price_from"], band.filters.get("sell_price_to")) for band in bands] == [(1500, 1999), (2000, 4999), (5000, None)]
+    assert ListingQuery().split_price((500, 1000)) == [
+        ListingQuery().price(None, 499), ListingQuery().price(500, 999), ListingQuery().price(1000, None)
+    ]
+
+def test_crawl_partitions():
+    with FakeListingServer(total_ads=200) as server:
+        scraper = autoplius_scraper(transport=Transport(limiter=RateLimiter(1000)), base_url=server.base_url)
+        scraper.crawl_partitions(ListingQuery(server.base_url).split_price((0, 20000, 50000)), 1000, workers=3, concurrency=2)
+        fords = autoplius_scraper(transport=Transport(limiter=RateLimiter(1000)), base_url=server.base_url)
+        fords.multiple_scrapes(1000, query=ListingQuery(server.base_url).make(1))
+    frame = scraper.into_pandas()
+    # adverts without a price match no price band
+    priced = [ad_id for ad_id in range(30000001, 30000201) if advert_attributes(ad_id)["price"] is not None]
+    assert frame["AdId"].is_unique and sorted(frame["AdId"].tolist()) == priced
+    assert (fords.into_pandas()["Marque"] == "Ford Transit Connect").all()
+
+def test_crawl_partitions_share_the_rate():
+    with FakeListingServer(total_ads=200) as server:
+        scraper = autoplius_scraper(base_url=server.base_url)
+        start = time.monotonic()
+        scraper.crawl_partitions(ListingQuery(server.base_url).split_price((0, 10000, 20000, 50000)), 1000, workers=4, rate=50)
+        seconds = time.monotonic() - start
+    assert server.requests > 10 and seconds >= 0.9 * (server.requests - 1) / 50
+    assert scraper.effective_rate() <= 55
+
+def test_work_queue_leases_and_retries(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"), max_attempts=2)
+    assert queue.add_page_ranges(ListingQuery(), 100, pages_per_shard=2) == [1, 2, 3]
+    shard = queue.claim("a", lease=0)
+    assert shard.first_page == 1 and shard.sample_size == 40
+    assert queue.claim("b").id == 1
+    assert not queue.complete(shard, "a", "lost.pkl")
+    queue.fail(shard, "b", "timeout")
+    assert queue.counts()["failed"] == 1
+    assert queue.claim("a").first_page == 3 and queue.claim("a").first_page == 5
+    assert queue.claim("a") is None
+    assert sqlite3.connect(queue.path).execute("PRAGMA journal_mode").fetchone() == ("delete",)
+    WorkQueue(queue.path, journal_mode="WAL")
+    assert sqlite3.connect(queue.path).execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+def test_distributed_crawl(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"))
+    with FakeListingServer(total_ads=200, churn=2) as server:
+        queue.add_page_ranges(ListingQuery(server.base_url), 200, pages_per_shard=3)
+        factory = lambda: autoplius_scraper(transport=Transport(limiter=RateLimiter(1000)))
+        workers = [
+            threading.Thread(target=run_worker, args=(queue, str(tmp_path / "results"), f"worker-{i}", factory))
+            for i in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    assert queue.finished() and queue.counts()["done"] == 4
+    assert all(path.endswith(".parquet") for path in queue.results())
+    merged = merge_results(queue)
+    assert merged["AdId"].is_unique and 150 < len(merged) < 200
+    assert merged["Marque"].dtype == "category"
+
+def test_sqlite_sink_history(tmp_path):
+    with open(fixture, "rb") as f:
+        cars = BeautifulSoup(f.read(), "html.parser").find_all("a", class_="announcement-item")
+    frame = normalize_records(extractor.extract_all(cars)).frame
+    days = iter(["2024-05-01", "2024-05-02", "2024-05-03"])
+    path = str(tmp_path / "autoplius.db")
+    with SqliteSink(path, clock=lambda: next(days)) as sink:
+        sink.write(frame)
+        sink.write(frame)
+        cheaper = frame.copy()
+        cheaper.loc[0, "Price_euro"] = 2000
+        sink.write(cheaper)
+        history = sink.history(17410251)
+    assert history.values.tolist() == [
+        [2200, 278154, "2024-05-01", "2024-05-02"],
+        [2000, 278154, "2024-05-03", "2024-05-03"],
+    ]
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*), MIN(first_seen), MAX(last_seen) FROM ads").fetchone() == (5, "2024-05-01", "2024-05-03")
+        assert db.execute("SELECT Price_euro, Power_kW FROM ads WHERE AdId = 17405537").fetchone() == (4800, None)
+
+
+def test_snapshot_diff(tmp_path):
+    with open(fixture, "rb") as f:
+        cars = BeautifulSoup(f.read(), "html.parser").find_all("a", class_="announcement-item")
+    previous = normalize_records(extractor.extract_all(cars)).frame
+    current = previous.iloc[1:].copy()
+    current.loc[1, "Price_euro"] = current.loc[1, "Price_euro"] - 300
+    current.loc[2, "Mileage_km"] = pd.NA
+    current = pd.concat([current, previous.iloc[:1].assign(AdId=1)], ignore_index=True)
+    changes = diff_snapshots(previous, current)
+    assert changes.added["AdId"].tolist() == [1]
+    assert changes.removed["AdId"].tolist() == [previous.loc[0, "AdId"]]
+    assert changes.changed["AdId"].tolist() == [previous.loc[1, "AdId"], previous.loc[2, "AdId"]]
+    assert changes.changed.loc[0, "Price_euro_change"] == -300
+    assert changes.changed.loc[1, "Mileage_km_current"] is pd.NA
+    assert diff_snapshots(current, current).changed.empty
+
+    scraper = autoplius_scraper()
+    scraper._autoplius_scraper__result = previous
+    snapshot, delta = str(tmp_path / "snapshot.csv"), str(tmp_path / "delta.csv")
+    assert scraper.into_delta(snapshot, delta).startswith("5 added, 0 removed and 0 changed")
+    assert read_snapshot(snapshot).dtypes.astype(str).equals(previous.dtypes.astype(str))
+    scraper._autoplius_scraper__result = current
+    assert scraper.into_delta(snapshot, delta).startswith("1 added, 1 removed and 2 changed")
+    assert pd.read_csv(delta)["change"].tolist() == ["added", "removed", "changed", "changed"]
+    scraper._autoplius_scraper__result = current.iloc[:2]
+    assert scraper.into_delta(snapshot, delta, track_removed=False).startswith("0 added, 0 removed and 0 changed")
+    assert len(read_snapshot(snapshot)) == len(current)
+    scraper._autoplius_scraper__result = current
+    assert scraper.into_delta(snapshot, delta).startswith("0 added, 0 removed and 0 changed")
+    for name in ("snapshot.parquet", "snapshot.feather"):
+        write_snapshot(previous, str(tmp_path / name))
+        write_snapshot(current, str(tmp_path / name))
+        pd.testing.assert_frame_equal(read_snapshot(str(tmp_path / name)), current, check_categorical=False)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".tmp-")]
+
+
+def test_cli_crawl_export_and_cold_start(tmp_path, capsys):
+    output, exported = str(tmp_path / "ads.parquet"), str(tmp_path / "ads.db")
+    with FakeListingServer(total_ads=100) as server:
+        cli(["crawl", "60", "--base-url", server.base_url, "--output", output, "--rate", "1000", "--cache-dir", str(tmp_path / "cache")])
+    assert "60 adverts have been exported" in capsys.readouterr().out
+    assert len(pd.read_parquet(output)) == 60
+    cli(["export", output, "--output", exported])
+    seen = str(tmp_path / "seen.txt")
+    with FakeListingServer(total_ads=100) as server:
+        for _ in range(2):
+            cli(["crawl", "40", "--base-url", server.base_url, "--output", output, "--rate", "1000", "--seen", seen, "--incremental"])
+    assert "0 adverts have been exported" in capsys.readouterr().out.splitlines()[-1]
+    with sqlite3.connect(exported) as db:
+        assert db.execute("SELECT COUNT(*) FROM ads").fetchone() == (60,)
+    assert all(not entry["heavy_modules"] for entry in bench_cold_start(repeat=1).values())
+
+
+def test_market_index_aggregates():
+    scraper = filled_scraper(600, page_size=200)
+    frame = scraper.into_pandas()
+    market = scraper.market_index()
+    priced = frame.dropna(subset=["Price_euro"])
+    for (marque, fuel), group in priced.groupby(["Marque", "FuelType"], observed=True):
+        stats = market.stats(marque=marque, fuel=fuel)
+        assert (stats["count"], stats["min"], stats["max"]) == (len(group), group["Price_euro"].min(), group["Price_euro"].max())
+        assert stats["mean"] == pytest.approx(group["Price_euro"].mean())
+        median = group["Price_euro"].astype(float).quantile(0.5, interpolation="lower")
+        assert abs(stats["median"] - median) <= 0.01 * median
+    assert market.stats()["count"] == len(priced)
+    assert market.stats("Mileage_km", year=2010)["count"] == frame.loc[frame["ManufacturingDate"] == 2010, "Mileage_km"].notna().sum()
+    assert market.ad_ids(fuel="Diesel", gearbox="Manual") == sorted(
+        frame.loc[(frame["FuelType"] == "Diesel") & (frame["Gearbox"] == "Manual"), "AdId"].tolist()
+    )
+
+    incremental = MarketIndex()
+    for start in range(0, len(frame), 20):
+        incremental.write(frame.iloc[start : start + 20])
+    incremental.write(frame.iloc[:50])
+    assert len(incremental) == len(frame)
+    columns = ["marque", "year"]
+    assert incremental.table(*columns).sort_values(columns, ignore_index=True).equals(market.table(*columns).sort_values(columns, ignore_index=True))
+    assert market.stats(marque="No such car")["count"] == 0
+    with pytest.raises(ValueError):
+        market.stats(colour="red")
+
+
+def test_scrape_views_into_pandas():
+    scraper = autoplius_scraper()
+    with open(fixture, "rb") as f:
+        scraper.parse_page(f.read())
+    scraper.find_announcements()
+    for view in (
+        scraper.scrape_marques,
+        scraper.scrape_carTypes,
+        scraper.scrape_fuels,
+        scraper.scrape_gearboxes,
+        scraper.scrape_years,
+        scraper.scrape_engines,
+        scraper.scrape_powers,
+        scraper.scrape_mileages,
+        scraper.scrape_prices,
+    ):
+        view()
+    result = scraper.into_pandas()
+    assert result.shape == (5, 10)
+    assert result["AdId"].notna().all()
+    pd.testing.assert_frame_equal(result, normalize_records(scraper.extract_records()).frame, check_categorical=False)
+
+
+def test_cli_forwards_benchmark_options(monkeypatch):
+    calls = []
+    monkeypatch.setattr("function.benchmark.main", calls.append)
+    cli(["benchmark", "--sizes", "1000", "10000", "--repeat", "1"])
+    assert calls == [["--sizes", "1000", "10000", "--repeat", "1"]]
+    with pytest.raises(SystemExit):
+        cli(["export", "autoplius.csv", "--sizes", "1000"])
+    with pytest.raises(SystemExit):
+        cli(["resume", "100", "--checkpoint", "no-such.checkpoint"])
+    with pytest.raises(SystemExit):
+        cli(["crawl", "100", "--incremental"])